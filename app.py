@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response, stream_with_context, send_file
 import os
 import json
 import datetime
@@ -10,14 +10,22 @@ from googleapiclient.discovery import build
 from urllib.parse import urlparse
 import hashlib
 from ytcm_utils import *
-import copy
-import time
+import asyncio
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from data_bag import ytcm_data
 from ytcm_messages_manager import ytcm_ChatMessagesManager, ytcm_HiddenMessagesManager
+from ytcm_ingestion_worker import ChatIngestionWorker
+from ytcm_chat_events import ChatEventBroadcaster
+from ytcm_async_runner import ytcm_async_runner
+from ytcm_quota_scheduler import ytcm_quota_scheduler
+from ytcm_audio_cache import ytcm_audio_cache
+from ytcm_tts_prefetcher import TTSPrefetcher
 
 app = Flask(__name__)
 
-ytcm_toggle_message_visibility_in_progress = 0
+# Serializes the changes to the stored messages: hide commands against the ingestion updates and publications
+ytcm_message_store_lock = threading.RLock()
 
 # Class to manage chat messages
 class ytcm_ChatMessageCustom:
@@ -41,11 +49,27 @@ class ytcm_ChatMessageCustom:
 ytcm_chat_messages_manager = ytcm_ChatMessagesManager()
 ytcm_hidden_messages_manager = ytcm_HiddenMessagesManager(messages=ytcm_chat_messages_manager)
 
+# Bound of the AI analyses running on the shared event loop, see ytcm_get_ai_semaphore()
+ytcm_ai_semaphore = None
+
+# Chat events fan-out for the stream clients
+ytcm_chat_event_broadcaster = ChatEventBroadcaster()
+
 # Service instances (initialized as None, will be set up later)
 ytcm_youtube_chat_reader: YouTubeChatReader = None
 ytcm_openai_service = None
 ytcm_polly_service: PollyService = None
 
+def ytcm_prefetch_audio(text, message_id, is_male):
+    """TTS prefetcher generation: uses the Polly service current at generation time"""
+    polly_service = ytcm_polly_service
+    if (not ytcm_data.ytcm_tts_enabled) or (not polly_service) or (not polly_service.is_available()):
+        return False
+    return polly_service.generate_audio(text, message_id, is_male)
+
+# Audio of the new messages generated in the background, before it is asked for
+ytcm_tts_prefetcher = TTSPrefetcher(ytcm_prefetch_audio)
+
 def ytcm_find_message(message: ytcm_ChatMessageCustom) -> bool:
     found = ytcm_chat_messages_manager.find_message(message)
     if found and YTCM_TRACE_MODE:
@@ -68,35 +92,77 @@ def ytcm_clear_audio_files():
             os.makedirs(ytcm_data.audio_file_dir_full_path)
             return jsonify({'success': True, 'message': 'Directory was empty'})
         
+        # The cached audio is kept for the next messages with the same text, only the message mappings are dropped
+        ytcm_tts_prefetcher.clear()
+        forgotten_count = ytcm_audio_cache.forget_messages()
+
         # Count the deleted files
         deleted_count = 0
         
-        # Delete all .mp3 files in the directory
+        # Delete the .mp3 files not belonging to the cache (e.g. named by message ID by older versions)
         for filename in os.listdir(ytcm_data.audio_file_dir_full_path):
-            if filename.endswith('.mp3'):
+            if filename.endswith('.mp3') and not ytcm_audio_cache.is_entry_file(filename):
                 file_path = os.path.join(ytcm_data.audio_file_dir_full_path, filename)
                 os.remove(file_path)
                 deleted_count += 1
                 info_log(f"Deleted audio file: {filename}")
         
-        info_log(f"Cleared {deleted_count} audio files from {ytcm_data.audio_file_dir_full_path}")
+        info_log(f"Cleared {forgotten_count} message audio mappings and {deleted_count} audio files from {ytcm_data.audio_file_dir_full_path}")
         
-        return jsonify({'success': True, 'message': f'Deleted {deleted_count} audio files'})
+        return jsonify({'success': True, 'message': f'Cleared {forgotten_count} message audio mappings, deleted {deleted_count} audio files'})
     
     except Exception as e:
         err_log(f"Error clearing audio files: {str(e)}")
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/ytcm_check_audio_file')
-def ytcm_check_audio_file():
-    message_id = request.args.get('id')
-    if not message_id:
-        return jsonify({'exists': False, 'error': 'Message ID is required'})
-    
-    file_path = os.path.join(ytcm_data.audio_file_dir_full_path, f"{message_id}.mp3")
-    exists = os.path.exists(file_path)
-    
-    return jsonify({'exists': exists})
+@app.route('/ytcm_get_audio_status', methods=['POST'])
+def ytcm_get_audio_status():
+    data = request.get_json(silent=True) or {}
+    message_ids = data.get('ids')
+    if not isinstance(message_ids, list):
+        return jsonify({'success': False, 'error': 'Message IDs are required'})
+
+    # Answered from the in-memory index of the audio cache
+    message_ids = [str(message_id) for message_id in message_ids[:YTCM_TTS_STATUS_MAX_IDS]]
+    audio = ytcm_audio_cache.get_messages_status(message_ids)
+    for message_id, status in audio.items():
+        status['pending'] = (not status['ready']) and ytcm_tts_prefetcher.is_pending(message_id)
+        status['url'] = f"/ytcm_audio/{message_id}.mp3" if status['ready'] else None
+
+    return jsonify({'success': True, 'audio': audio})
+
+@app.route('/ytcm_audio/<message_id>.mp3')
+def ytcm_get_audio_file(message_id):
+    # Audio pre-generated in the background: better wait for it than synthesize it twice
+    ytcm_tts_prefetcher.wait(message_id, YTCM_HTTP_READ_TIMEOUT_S)
+    file_path = ytcm_audio_cache.get_message_path(message_id)
+
+    # The text is read from the stored message (long texts would not fit in the URL)
+    chat_msg = ytcm_chat_messages_manager.get_message(message_id) if not file_path else None
+    if chat_msg:
+        # Not generated yet: synthesized now and streamed while Polly sends it
+        if not ytcm_data.ytcm_tts_enabled:
+            return jsonify({'success': False, 'error': 'TTS service is not enabled'}), 404
+        polly_service = ytcm_polly_service
+        if (not polly_service) or (not polly_service.is_available()):
+            err_log("Attempt to stream audio with Polly service not available")
+            return jsonify({'success': False, 'error': 'AWS Polly service not available'}), 503
+        try:
+            file_path, chunks = polly_service.stream_audio(ytcm_message_tts_text(chat_msg), message_id, chat_msg.is_male)
+        except TimeoutError:
+            # Same audio synthesized for another request for too long: the client retries instead of synthesizing it again
+            err_log(f"Audio still being synthesized for message_id: {message_id}")
+            return jsonify({'success': False, 'error': 'Audio being generated'}), 503, {'Retry-After': str(YTCM_TTS_RETRY_AFTER_S)}
+        if chunks is not None:
+            info_log(f"Streaming audio for message_id: {message_id}")
+            # The length is unknown while synthesizing: range requests are answered once the audio is cached
+            return Response(chunks, mimetype='audio/mpeg', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    if not file_path:
+        return jsonify({'success': False, 'error': 'Audio not found'}), 404
+
+    # Conditional and range requests are answered from the cache entry (ETag / Last-Modified)
+    return send_file(file_path, mimetype='audio/mpeg', conditional=True)
 
 @app.route('/ytcm_generate_audio', methods=['POST'])
 def ytcm_generate_audio():
@@ -128,6 +194,12 @@ def ytcm_generate_audio():
         
         info_log(f"Audio generation request for message_id: {message_id}, text length: {len(text)}")
         
+        # Audio pre-generated (or being pre-generated) in the background
+        ytcm_tts_prefetcher.wait(message_id, YTCM_HTTP_READ_TIMEOUT_S)
+        if ytcm_audio_cache.get_message_key(message_id):
+            info_log(f"Audio already generated for message_id: {message_id}")
+            return jsonify({'success': True})
+
         # Generate the audio file
         success = ytcm_polly_service.generate_audio(text, message_id, is_male)
         
@@ -168,10 +240,14 @@ def ytcm_connect(resume_only=False):
         if ytcm_data.ytcm_tts_enabled and ((not ytcm_polly_service) or (not ytcm_polly_service.is_available())):
             ytcm_polly_service = PollyService(YTCM_POLLY_CONFIG_FILE)
         
-        # Service initialization
-        ytcm_youtube_chat_reader = YouTubeChatReader()
-
-        if ytcm_data.ytcm_ai_needed:
+        # Service initialization (on resume an already connected reader is kept, together with its caches)
+        if not (resume_only and ytcm_youtube_chat_reader and ytcm_youtube_chat_reader.connected):
+            ytcm_youtube_chat_reader = YouTubeChatReader()
+
+        # The service is kept with its pooled connections, unless the API key changed
+        if ytcm_data.ytcm_ai_needed and not (isinstance(ytcm_openai_service, OpenAIService) and (ytcm_openai_service.api_key == openai_config['api_key'])):
+            if isinstance(ytcm_openai_service, OpenAIService):
+                ytcm_openai_service.close()
             ytcm_openai_service = OpenAIService(openai_config['api_key'])
         
         # Connection to YouTube
@@ -183,14 +259,19 @@ def ytcm_connect(resume_only=False):
                 info_log("YouTube connection resumed")
             else:
                 info_log("YouTube connection in progress...")
-                # Clear messages
-                ytcm_chat_messages_manager.clear_messages()
+                # Clear messages (a cycle in flight checks the worker generation under the same lock)
+                with ytcm_message_store_lock:
+                    ytcm_ingestion_worker.stop()
+                    ytcm_chat_messages_manager.clear_messages()
                 ytcm_clear_audio_files()
                 if isinstance(success, str):
                     res = urlparse(success)
                     if all([res.scheme, res.netloc]) and (res.scheme == 'https') and ('.' in res.netloc):
                         return jsonify({'success': True, 'auth_url': success})
 
+            # Chat messages are read in the background from now on
+            ytcm_ingestion_worker.start()
+
             return jsonify({'success': True})
         else:
             err_log("Error connecting to YouTube")
@@ -253,15 +334,21 @@ def ytcm_disconnect():
     global ytcm_youtube_chat_reader, ytcm_openai_service
 
     try:
+        with ytcm_message_store_lock:
+            ytcm_ingestion_worker.stop()
+
         if ytcm_youtube_chat_reader:
             ytcm_youtube_chat_reader.disconnect()
             ytcm_youtube_chat_reader = None
         
         if ytcm_openai_service:
+            if isinstance(ytcm_openai_service, OpenAIService):
+                ytcm_openai_service.close()
             ytcm_openai_service = not ytcm_data.ytcm_ai_needed
         
         # Clear messages
-        ytcm_chat_messages_manager.clear_messages()
+        with ytcm_message_store_lock:
+            ytcm_chat_messages_manager.clear_messages()
 
         ytcm_clear_audio_files()
         
@@ -276,49 +363,140 @@ def ytcm_disconnect():
 @app.route('/ytcm_toggle_message_visibility', methods=['POST'])
 def ytcm_toggle_message_visibility():
 
-    global ytcm_toggle_message_visibility_in_progress
-    
-    ytcm_toggle_message_visibility_in_progress += 1
     try:
+        # Get message ID and new show value from request
+        data = request.get_json()
+        message_id = data.get('id')
+        show_value = data.get('show', False)
+        
+        if not message_id:
+            return jsonify({'success': False, 'error': 'Message ID is required'})
 
-        try:
-            # Get message ID and new show value from request
-            data = request.get_json()
-            message_id = data.get('id')
-            show_value = data.get('show', False)
-            
-            if not message_id:
-                return jsonify({'success': False, 'error': 'Message ID is required'})
-
-            # Update visibility in the hidden IDs manager
-            if not show_value:
+        # Update visibility in the hidden IDs manager
+        if not show_value:
+            with ytcm_message_store_lock:
                 ytcm_hidden_messages_manager.add_hidden_id(message_id)
-                for i in range(len(ytcm_data.last_formatted_messages)):
-                    if ytcm_data.last_formatted_messages[i].get("id") == message_id:
-                        ytcm_data.last_formatted_messages[i]["show"] = False
-                        break
+                # Publishes a new snapshot without the message, the next ingestion cycle reads it from the hidden IDs
+                ytcm_chat_event_broadcaster.hide(message_id)
+            ytcm_tts_prefetcher.cancel(message_id)
 
-                info_log(f"Message visibility changed: {message_id} - show: {show_value}")
+            info_log(f"Message visibility changed: {message_id} - show: {show_value}")
 
-            return jsonify({'success': True})
-    
-        except Exception as e:
-            err_log(f"Error toggling message visibility: {str(e)}")
-            return jsonify({'success': False, 'error': str(e)})
-
-    finally:
-        ytcm_toggle_message_visibility_in_progress -= 1
-
-@app.route('/ytcm_get_messages')
-def ytcm_get_messages():
-    
-    if ytcm_data.ytcm_get_messages_in_progress:
-        info_log(f"Giving last_formatted_messages: {ytcm_data.last_formatted_messages}")
-        return jsonify({'success': True, 'messages': ytcm_data.last_formatted_messages})
+        return jsonify({'success': True})
 
-    ytcm_data.ytcm_get_messages_in_progress = True
+    except Exception as e:
+        err_log(f"Error toggling message visibility: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)})
 
-    try:
+def ytcm_prefetch_message_audio(chat_msg):
+    """Queues the audio generation of a new visible message, as configured by YTCM_TTS_PREFETCH"""
+    if (not chat_msg.show) or (not ytcm_data.ytcm_tts_enabled) or (YTCM_TTS_PREFETCH not in ('all', 'questions')):
+        return
+    if (YTCM_TTS_PREFETCH == 'questions') and (not chat_msg.is_question):
+        return
+    ytcm_tts_prefetcher.enqueue(chat_msg.id, ytcm_message_tts_text(chat_msg), chat_msg.is_male)
+
+def ytcm_message_tts_text(chat_msg):
+    """Returns the text read by the TTS service for a message, the same as sent by the client when the overlay is opened"""
+    return chat_msg.text.upper() if YTCM_FORCE_MSG_UPPERCASE else chat_msg.text
+
+def ytcm_get_ai_semaphore():
+    """Returns the bound of the awaitable analyses, created on the shared event loop at first use
+
+    Before Python 3.10 asyncio objects are bound to the event loop current at their creation,
+    so it cannot be created at import time in the main thread.
+    """
+    global ytcm_ai_semaphore
+    if ytcm_ai_semaphore is None:
+        ytcm_ai_semaphore = asyncio.Semaphore(YTCM_AI_CONCURRENCY)
+    return ytcm_ai_semaphore
+
+async def ytcm_analyze_message_separately(msg):
+    """Analyzes a chat message with one OpenAI request per analysis enabled by the YTCM_* flags (returns a one-item list, as ytcm_analyze_message_chunk())"""
+
+    async with ytcm_get_ai_semaphore():
+        # Verify if the message is a question via OpenAI
+        analysis = {'is_question': (not YTCM_QUESTIONS_ONLY) or await ytcm_openai_service.is_question_async(msg['text']), 'is_appropriate': False, 'text': None, 'is_male': None}
+
+        if (not YTCM_APPLY_MODERATION) or await ytcm_openai_service.is_appropriate_async(msg['text']):
+            analysis['is_appropriate'] = True
+            analysis['text'] = msg['text']
+            if YTCM_APPLY_SPELLING_CORRECTION:
+                # Correct spelling and improve text form while preserving special placeholders
+                analysis['text'] = await ytcm_openai_service.correct_text_async(msg['text'])
+            analysis['is_male'] = (not YTCM_RETRIEVE_MSG_AUTHOR_GENDER) or await ytcm_openai_service.is_male_username_async(msg['author'])
+
+    return [analysis]
+
+async def ytcm_analyze_message_chunk(messages):
+    """Analyzes chat messages with the fused or batch OpenAI requests, as set by YTCM_AI_ANALYSIS_MODE"""
+
+    async with ytcm_get_ai_semaphore():
+        if YTCM_AI_ANALYSIS_MODE == 'fused':
+            # One OpenAI request per message for all the analyses (moderation runs alongside)
+            results = [await ytcm_openai_service.analyze_async(msg['text'], msg['author'], questions=YTCM_QUESTIONS_ONLY, moderation=YTCM_APPLY_MODERATION, gender=YTCM_RETRIEVE_MSG_AUTHOR_GENDER, correction=YTCM_APPLY_SPELLING_CORRECTION) for msg in messages]
+        else:
+            # Several messages per OpenAI request
+            results = await ytcm_openai_service.classify_batch_async(messages, questions=YTCM_QUESTIONS_ONLY, moderation=YTCM_APPLY_MODERATION, gender=YTCM_RETRIEVE_MSG_AUTHOR_GENDER, correction=YTCM_APPLY_SPELLING_CORRECTION)
+
+    return [{
+        'is_question': (not YTCM_QUESTIONS_ONLY) or result['is_question'],
+        'is_appropriate': (not YTCM_APPLY_MODERATION) or result['is_appropriate'],
+        'text': result['text'] if YTCM_APPLY_SPELLING_CORRECTION else msg['text'],
+        'is_male': (not YTCM_RETRIEVE_MSG_AUTHOR_GENDER) or result['is_male']
+    } for msg, result in zip(messages, results)]
+
+def ytcm_analysis_cancelled(live_chat_id):
+    """Checks if the analysis of the messages read from live_chat_id is no longer needed"""
+    if not ytcm_ingestion_worker.is_running():
+        return True
+    current_live_chat_id = ytcm_youtube_chat_reader.get_live_chat_id() if ytcm_youtube_chat_reader else None
+    # An error (False) while checking does not cancel anything
+    return (current_live_chat_id is not False) and (current_live_chat_id != live_chat_id)
+
+def ytcm_analyze_messages(messages, live_chat_id):
+    """Runs the AI analysis enabled by the YTCM_* flags on new chat messages, YTCM_AI_CONCURRENCY at a time
+
+    Args:
+        messages (list): Chat messages (dicts with 'author' and 'text')
+        live_chat_id (str): ID of the live chat the messages were read from
+
+    Returns:
+        list: One dict per message (in the same order) with 'is_question', 'is_appropriate', 'text' and 'is_male',
+              None if the analysis was cancelled because the live chat changed or the ingestion stopped
+    """
+    # All the requests are awaitable: they run on the shared event loop
+    if YTCM_AI_ANALYSIS_MODE == 'batch':
+        futures = [ytcm_async_runner.submit(ytcm_analyze_message_chunk(messages[start:start + YTCM_AI_BATCH_SIZE])) for start in range(0, len(messages), YTCM_AI_BATCH_SIZE)]
+    elif YTCM_AI_ANALYSIS_MODE == 'fused':
+        futures = [ytcm_async_runner.submit(ytcm_analyze_message_chunk([msg])) for msg in messages]
+    else:
+        futures = [ytcm_async_runner.submit(ytcm_analyze_message_separately(msg)) for msg in messages]
+
+    # Results are collected in chat order, whatever the order they complete in
+    analyses = []
+    for future in futures:
+        while True:
+            if ytcm_analysis_cancelled(live_chat_id):
+                cancelled = [f.cancel() for f in futures].count(True)
+                info_log(f"Analysis of the messages of live chat {live_chat_id} cancelled ({cancelled} requests not started)")
+                return None
+            try:
+                analyses.extend(future.result(timeout=1))
+                break
+            except FutureTimeoutError:
+                # Still running: check again if the analysis is still needed
+                continue
+
+    return analyses
+
+# Result of an ingestion cycle started before the worker was stopped
+ytcm_stale_cycle_payload = {'success': False, 'error': 'Chat ingestion stopped'}
+
+def ytcm_refresh_messages():
+    """Runs one ingestion cycle: reads the new chat messages, processes them and returns the response payload"""
+
+    with app.app_context():
 
         try:
 
@@ -328,7 +506,7 @@ def ytcm_get_messages():
             info_log(f"current_live_title initialized: {current_live_title}")
 
             if not ytcm_youtube_chat_reader or not ytcm_openai_service:
-                return jsonify({'success': False, 'error': 'Not connected to YouTube'})
+                return {'success': False, 'error': 'Not connected to YouTube'}
                 
             live_chat_id = ytcm_youtube_chat_reader.get_live_chat_id()
             info_log(f"live_chat_id modified: {live_chat_id}")
@@ -380,7 +558,7 @@ def ytcm_get_messages():
             
                 err_log("Reading messages a communication error occurred with the Google server", None)
 
-                return jsonify({'success': False, 'error': 'Oops! We couldn’t reach the Google server. \nIt looks like your query limit might be used up. \nThe query quota may have been exceeded. Please check your account limits.'})
+                return {'success': False, 'error': 'Oops! We couldn’t reach the Google server. \nIt looks like your query limit might be used up. \nThe query quota may have been exceeded. Please check your account limits.'}
 
             if (new_messages == None) or ((len(new_messages) == 0) and (current_live_title == None)):
                 ytcm_chat_messages_manager.clear_messages()
@@ -391,52 +569,48 @@ def ytcm_get_messages():
                 if current_live_title:
                     message_ls = [current_live_title]
                     info_log(f"Forcing send messages when no new messages: {message_ls}")
-                    return jsonify({'success': True, 'messages': message_ls, 'error': 'No live stream found on the channel'})
+                    return {'success': True, 'messages': message_ls, 'error': 'No live stream found on the channel'}
 
             if new_messages != None:
-                # Process new messages
+                # Select the messages to process, reusing the results of the ones already processed
+                chat_msgs = []
+                to_analyze = []
                 for msg in new_messages:
                     # Verify that the message has at least minimum words
                     words = msg['text'].split()
                     if ((not YTCM_IGNORE_CHANNEL_OWNER_MESSAGES) or (msg['author'] != ytcm_data.channel_name)) and (len(words) >= YTCM_MIN_MESSAGE_WORDS):
 
-                        chat_msg = None
-
-                        # Check if message already exists in last_formatted_messages
-                        matching_messages = [
-                            formatted_msg for formatted_msg in ytcm_data.last_formatted_messages 
-                            if formatted_msg.get('author') == msg['author'] and 
-                            formatted_msg.get('datetime') == msg['published_at']
-                        ]
+                        # Check if the message was already processed (the stored messages are the ones last sent)
+                        found_msg = ytcm_chat_messages_manager.find_message_by_author_time(msg['author'], msg['published_at'])
                         
-                        if matching_messages and (len(matching_messages) > 0):
-                            found_msg = matching_messages[0]                            
+                        if found_msg:
                             # Create a new custom message
-                            chat_msg = ytcm_ChatMessageCustom(msg['author'], found_msg.get('text'), (not YTCM_RETRIEVE_MSG_AUTHOR_GENDER) or found_msg.get('is_male'), msg['text'], msg['published_at'], found_msg.get('is_question'))
+                            chat_msg = ytcm_ChatMessageCustom(msg['author'], found_msg.text, (not YTCM_RETRIEVE_MSG_AUTHOR_GENDER) or found_msg.is_male, msg['text'], msg['published_at'], found_msg.is_question)
+                            chat_msgs.append(chat_msg)
                             
                             info_log(f"Yet processed message found: {chat_msg}")
 
                         else:
-
-                            # Verify if the message is a question via OpenAI
-                            is_question = (not YTCM_QUESTIONS_ONLY) or ytcm_openai_service.is_question(msg['text'])
-                            
-                            if (not YTCM_APPLY_MODERATION) or ytcm_openai_service.is_appropriate(msg['text']):
-                            
-                                info_log(f"New message approved: {msg['author']} - {msg['text']}")
-
-                                msg_text = msg['text']
-                                if YTCM_APPLY_SPELLING_CORRECTION:
-                                    # Correct spelling and improve text form while preserving special placeholders
-                                    msg_text = ytcm_openai_service.correct_text(msg_text)
-                            
-                                # Create a new custom message
-                                chat_msg = ytcm_ChatMessageCustom(msg['author'], msg_text, (not YTCM_RETRIEVE_MSG_AUTHOR_GENDER) or ytcm_openai_service.is_male_username(msg['author']), msg['text'], msg['published_at'], is_question)
-
+                            chat_msgs.append(None)
+                            to_analyze.append((len(chat_msgs) - 1, msg))
+
+                # Analyze the new messages via OpenAI
+                analyses = ytcm_analyze_messages([msg for i, msg in to_analyze], ytcm_youtube_chat_reader.live_chat_id) or []
+                for (i, msg), analysis in zip(to_analyze, analyses):
+                    if analysis['is_appropriate']:
+                    
+                        info_log(f"New message approved: {msg['author']} - {msg['text']}")
+
+                        # Create a new custom message
+                        chat_msgs[i] = ytcm_ChatMessageCustom(msg['author'], analysis['text'], analysis['is_male'], msg['text'], msg['published_at'], analysis['is_question'])
+
+                # Process new messages (in chat order)
+                with ytcm_message_store_lock:
+                    if not ytcm_ingestion_worker.is_current_cycle():
+                        # Stopped (disconnection or new connection) while reading: the messages belong to the old session
+                        return ytcm_stale_cycle_payload
+                    for chat_msg in chat_msgs:
                         if chat_msg:
-                            while ytcm_toggle_message_visibility_in_progress > 0:
-                                time.sleep(0.1)
-
                             # Check if the message is hidden
                             if ytcm_hidden_messages_manager.is_hidden(chat_msg.id):
                                 info_log(f"Message recognized as hidden: {chat_msg} ({chat_msg.id})")
@@ -447,24 +621,25 @@ def ytcm_get_messages():
                                 if not chat_msg.show:
                                     ytcm_chat_messages_manager.update_message_visibility(chat_msg.id, False)
                             else:
-        #                        if chat_msg.show:
+    #                            if chat_msg.show:
                                 ytcm_chat_messages_manager.add_message(chat_msg)
                                 info_log(f"Message added to the list: {chat_msg}")        
-
-            while ytcm_toggle_message_visibility_in_progress > 0:
-                time.sleep(0.1)
+                                ytcm_prefetch_message_audio(chat_msg)
 
             # Format messages for the response
-            formatted_messages = [{
-                'id': msg.id,
-                'author': msg.author,
-                'text': msg.text,
-                'datetime': msg.datetime,
-                'is_male': msg.is_male,
-                'show': msg.show and (not ytcm_hidden_messages_manager.is_hidden(msg.id)),
-                'is_question': bool(msg.is_question),
-                'live_title': None
-            } for msg in ytcm_chat_messages_manager.get_messages()]
+            with ytcm_message_store_lock:
+                if not ytcm_ingestion_worker.is_current_cycle():
+                    return ytcm_stale_cycle_payload
+                formatted_messages = [{
+                    'id': msg.id,
+                    'author': msg.author,
+                    'text': msg.text,
+                    'datetime': msg.datetime,
+                    'is_male': msg.is_male,
+                    'show': msg.show and (not ytcm_hidden_messages_manager.is_hidden(msg.id)),
+                    'is_question': bool(msg.is_question),
+                    'live_title': None
+                } for msg in ytcm_chat_messages_manager.get_messages()]
 
             if (clean_msg_list or (len(formatted_messages) == 0)) and (live_chat_id != False):
                 current_live_title = {'live_title': ytcm_youtube_chat_reader.get_live_title(), 'clean_msg_list': True}
@@ -473,19 +648,95 @@ def ytcm_get_messages():
             if current_live_title:
                 formatted_messages.insert(0, current_live_title)
 
-            ytcm_data.last_formatted_messages = copy.deepcopy(formatted_messages)
+            # Built anew at every cycle and never modified afterwards: published without copying
+            ytcm_data.last_formatted_messages = formatted_messages
                                         
             info_log(f"Sending messages: {formatted_messages}")
             info_log(f"last_formatted_messages updated: {ytcm_data.last_formatted_messages}")
 
-            return jsonify({'success': True, 'messages': formatted_messages})
+            return {'success': True, 'messages': formatted_messages}
         
         except Exception as e:
             err_log(f"Error reading messages: {str(e)}")
-            return jsonify({'success': False, 'error': str(e)})
-        
-    finally:
-        ytcm_data.ytcm_get_messages_in_progress = False    
+            return {'success': False, 'error': str(e)}
+
+def ytcm_ingestion_cycle():
+    """Ingestion worker cycle: refreshes the messages and schedules the next read as asked by YouTube"""
+    payload = ytcm_refresh_messages()
+    with ytcm_message_store_lock:
+        if not ytcm_ingestion_worker.is_current_cycle():
+            # Started before the last stop(): never published (the worker drops it as well)
+            return payload, 0
+        if payload.get('success') and any(msg.get('show') and ytcm_hidden_messages_manager.is_hidden(msg.get('id')) for msg in payload.get('messages', [])):
+            # Messages hidden after the list was formatted must not be published as visible
+            payload = dict(payload, messages=[dict(msg, show=False) if msg.get('show') and ytcm_hidden_messages_manager.is_hidden(msg.get('id')) else msg for msg in payload.get('messages', [])])
+        ytcm_chat_event_broadcaster.publish(payload)
+    # Adapted to the chat velocity and to the YouTube quota left
+    next_delay_ms = ytcm_quota_scheduler.next_interval_ms()
+    if not payload.get('success'):
+        next_delay_ms = max(next_delay_ms, YTCM_POLLING_INTERVAL_MS)
+    return payload, next_delay_ms
+
+ytcm_ingestion_worker = ChatIngestionWorker(ytcm_ingestion_cycle)
+
+@app.route('/ytcm_get_messages')
+def ytcm_get_messages():
+
+    if not ytcm_youtube_chat_reader or not ytcm_openai_service:
+        return jsonify({'success': False, 'error': 'Not connected to YouTube'})
+
+    # Only the last published result is read here, the ingestion runs in the background
+    since = request.args.get('since')
+    if since:
+        # Only the changes after the cursor (the whole list if the cursor can't be resumed)
+        events = ytcm_chat_event_broadcaster.get_events(since)
+        cursor = events[-1][0] if events else since
+        response = jsonify({'success': True, 'cursor': cursor, 'events': [{'type': event_type, 'data': data} for event_id, event_type, data in events]})
+    else:
+        snapshot = ytcm_chat_event_broadcaster.get_snapshot()
+        if (snapshot is None) and (ytcm_ingestion_worker.get_snapshot() is None):
+            # First read after connecting: all the callers wait for the same cycle instead of receiving an empty list
+            ytcm_ingestion_worker.wait_for_cycle(YTCM_INGESTION_WAIT_TIMEOUT_S)
+            snapshot = ytcm_chat_event_broadcaster.get_snapshot()
+        if snapshot:
+            # Serialized once per snapshot version, whatever the number of clients
+            cursor = snapshot.version
+            response = app.response_class(snapshot.json_bytes(), mimetype='application/json')
+        else:
+            cursor = ytcm_chat_event_broadcaster.get_cursor()
+            payload = ytcm_ingestion_worker.get_snapshot() or {'success': True, 'messages': ytcm_data.last_formatted_messages}
+            response = jsonify(dict(payload, cursor=cursor))
+
+    # A client already up to date with the cursor gets an empty 304 response
+    response.set_etag(cursor)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/ytcm_get_quota_status')
+def ytcm_get_quota_status():
+    """Returns the YouTube Data API quota used and left today, with the current polling interval"""
+    return jsonify({'success': True, 'quota': ytcm_quota_scheduler.get_status()})
+
+@app.route('/ytcm_stream')
+def ytcm_stream():
+
+    # Browsers send back the ID of the last received event when they reconnect
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
+    def generate(last_event_id):
+        yield f"retry: {YTCM_STREAM_RETRY_MS}\n\n"
+        while True:
+            events = ytcm_chat_event_broadcaster.get_events(last_event_id, YTCM_STREAM_KEEPALIVE_S)
+            if not events:
+                # Keeps the connection open through proxies and detects the closed ones
+                yield ": keepalive\n\n"
+            for event_id, event_type, data in events:
+                last_event_id = event_id
+                yield ChatEventBroadcaster.format_event(event_id, event_type, data)
+
+    info_log(f"Stream client connected (last event ID: {last_event_id})")
+
+    return Response(stream_with_context(generate(last_event_id)), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 if __name__ == '__main__':
     # Create necessary directories
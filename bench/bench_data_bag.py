@@ -0,0 +1,72 @@
+"""Cost of the StoredDataBag observable list mutations and attribute reads, before and after write-behind saving.
+
+Without --revision the benchmark runs twice: on a revision before the saves were coalesced
+(every mutation wrote the whole file, every read checked it), by default where HEAD forked from
+the main branch, and on the working tree.
+
+    python bench/bench_data_bag.py [--before REV | --base BRANCH] [--revision REV] [--items 500] [--mutations 200]
+"""
+import os
+import sys
+import gc
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sandbox import enter_sandbox, merge_base, run_revisions
+
+def bench_data_bag(items, mutations):
+    """Return the average microseconds of an append to an observable list and of an attribute read."""
+    from data_bag import StoredDataBag
+
+    bag = StoredDataBag(os.path.join(os.getcwd(), 'data', 'bench-data.json'))
+    # A list of the size of the formatted messages kept by the application
+    bag.set('bench_list', [{'id': str(number), 'text': f"Message number {number}", 'show': True} for number in range(items)])
+    bench_list = bag.get('bench_list')
+    bag.set('bench_value', 'value')
+
+    start = time.perf_counter()
+    for number in range(mutations):
+        bench_list.append({'id': f"new-{number}", 'text': f"New message number {number}", 'show': True})
+    append_us = (time.perf_counter() - start) * 1e6 / mutations
+
+    start = time.perf_counter()
+    for _ in range(mutations):
+        bag.get('bench_value')
+    read_us = (time.perf_counter() - start) * 1e6 / mutations
+
+    # The data bags before write-behind saving have no flush() (and return None for any attribute)
+    if callable(getattr(type(bag), 'flush', None)):
+        bag.flush()
+    del bench_list, bag
+    return append_us, read_us
+
+def close_data_bags():
+    """Release the data bags now: their __del__ saves them, which fails while the interpreter shuts down."""
+    import data_bag
+    data_bag.ytcm_data._data_bag = None
+    gc.collect()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--revision', default=None, help="git revision to measure ('' = the working tree, default: before and after)")
+    parser.add_argument('--before', default=None, help="revision saving the data bag at every change (default: the merge base of HEAD and --base)")
+    parser.add_argument('--base', default='main', help="branch HEAD forked from, giving the default --before revision")
+    parser.add_argument('--items', type=int, default=500, help="items of the observable list")
+    parser.add_argument('--mutations', type=int, default=200, help="appends and reads measured")
+    args = parser.parse_args()
+
+    if args.revision is None:
+        before = args.before or merge_base(args.base)
+        if not before:
+            parser.error(f"no merge base of HEAD and {args.base}: give the revision to compare with --before")
+        run_revisions(os.path.abspath(__file__), [('before', before), ('after', None)], ['--items', str(args.items), '--mutations', str(args.mutations)])
+        return
+
+    enter_sandbox(args.revision or None)
+    append_us, read_us = bench_data_bag(args.items, args.mutations)
+    close_data_bags()
+    print(f"append: {append_us:10.1f} us    read: {read_us:10.1f} us", flush=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Cost of the duplicate message checks with 1k, 10k and 100k stored messages.
+
+The ingestion cycle checks every new message against the store, by ID (find_message) and by
+author and publication time (find_message_by_author_time): both go through hash indexes, so
+the cost of a check does not depend on the number of stored messages.
+
+    python bench/bench_dedup.py [--revision REV] [--sizes 1000,10000,100000] [--lookups 20000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sandbox import enter_sandbox, write_history, BenchMessage
+
+def bench_lookups(size, lookups):
+    """Return the average microseconds of each kind of check with size stored messages."""
+    from ytcm_messages_manager import ytcm_ChatMessagesManager
+
+    file_path = os.path.join(os.getcwd(), 'data', f"bench-messages-{size}.json")
+    write_history(file_path, size)
+    manager = ytcm_ChatMessagesManager(file_path)
+
+    # Half of the checked messages are already stored, half are new
+    numbers = [random.randrange(size * 2) for _ in range(lookups)]
+    messages = [BenchMessage(number) for number in numbers]
+
+    start = time.perf_counter()
+    found_by_id = sum(1 for message in messages if manager.find_message(message))
+    by_id_us = (time.perf_counter() - start) * 1e6 / lookups
+
+    start = time.perf_counter()
+    found_by_time = sum(1 for message in messages if manager.find_message_by_author_time(message.author, message.datetime))
+    by_time_us = (time.perf_counter() - start) * 1e6 / lookups
+
+    assert found_by_id == found_by_time == sum(1 for number in numbers if number < size)
+    return by_id_us, by_time_us
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--revision', default='', help="git revision to measure (default: the working tree)")
+    parser.add_argument('--sizes', default='1000,10000,100000', help="stored messages")
+    parser.add_argument('--lookups', type=int, default=20000, help="checks measured per size")
+    args = parser.parse_args()
+
+    enter_sandbox(args.revision or None)
+    print(f"{'stored':>8} {'by ID (us)':>11} {'by author/time (us)':>20}")
+    for size in (int(size) for size in args.sizes.split(',')):
+        by_id_us, by_time_us = bench_lookups(size, args.lookups)
+        print(f"{size:>8} {by_id_us:>11.2f} {by_time_us:>20.2f}", flush=True)
+
+if __name__ == '__main__':
+    main()
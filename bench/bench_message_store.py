@@ -0,0 +1,56 @@
+"""Cost of a chat poll against the message store as the history grows.
+
+A poll looks up and adds YTCM-like new messages one by one, then lists the messages, as the
+ingestion cycle does. With the in-memory indexed store the cost stays flat up to 10k stored
+messages; run with --revision of an older tree to compare.
+
+    python bench/bench_message_store.py [--revision REV] [--sizes 100,1000,10000] [--polls 5]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sandbox import enter_sandbox, write_history, BenchMessage
+
+NEW_MESSAGES_PER_POLL = 20
+
+def bench_poll(size, polls):
+    """Return the average milliseconds of a poll with size stored messages."""
+    from ytcm_messages_manager import ytcm_ChatMessagesManager
+
+    file_path = os.path.join(os.getcwd(), 'data', f"bench-messages-{size}.json")
+    write_history(file_path, size)
+    manager = ytcm_ChatMessagesManager(file_path)
+
+    number = size
+    elapsed = 0.0
+    for _ in range(polls):
+        start = time.perf_counter()
+        for _ in range(NEW_MESSAGES_PER_POLL):
+            message = BenchMessage(number)
+            number += 1
+            if not manager.find_message(message):
+                manager.add_message(message)
+        manager.get_messages()
+        elapsed += time.perf_counter() - start
+    if hasattr(manager, 'flush'):
+        manager.flush()
+    return elapsed * 1000 / polls
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--revision', default='', help="git revision to measure (default: the working tree)")
+    parser.add_argument('--sizes', default='100,1000,5000,10000', help="stored messages before the polls")
+    parser.add_argument('--polls', type=int, default=5, help="polls measured per size")
+    args = parser.parse_args()
+
+    enter_sandbox(args.revision or None)
+    print(f"{'stored':>8} {'ms/poll':>10} {'ms/message':>11}")
+    for size in (int(size) for size in args.sizes.split(',')):
+        ms = bench_poll(size, args.polls)
+        print(f"{size:>8} {ms:>10.2f} {ms / NEW_MESSAGES_PER_POLL:>11.3f}", flush=True)
+
+if __name__ == '__main__':
+    main()
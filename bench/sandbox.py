@@ -0,0 +1,85 @@
+"""Throwaway copies of the application for the benchmark and stress scripts.
+
+The stores write to data/ and logs/ next to their modules: the scripts import the modules from a
+temporary copy of the tree (the working tree, or any git revision to compare with), so the
+data of the checkout is never touched.
+"""
+import os
+import sys
+import atexit
+import json
+import hashlib
+import logging
+import glob
+import shutil
+import tempfile
+import subprocess
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+def enter_sandbox(revision=None):
+    """Copy the application modules to a temporary directory and import from there.
+
+    Args:
+        revision (str): Git revision to copy (None = the working tree).
+
+    Returns:
+        str: The sandbox directory.
+    """
+    root = tempfile.mkdtemp(prefix='ytcm-bench-')
+    atexit.register(shutil.rmtree, root, True)
+    if revision:
+        archive = subprocess.run(['git', 'archive', revision], cwd=REPO_DIR, check=True, capture_output=True).stdout
+        subprocess.run(['tar', '-x', '-C', root], input=archive, check=True)
+    else:
+        for path in glob.glob(os.path.join(REPO_DIR, '*.py')):
+            shutil.copy(path, root)
+        for directory in ('templates', 'static'):
+            if os.path.isdir(os.path.join(REPO_DIR, directory)):
+                shutil.copytree(os.path.join(REPO_DIR, directory), os.path.join(root, directory), ignore=shutil.ignore_patterns('tmp'))
+    os.chdir(root)
+    sys.path.insert(0, root)
+
+    # The debug log would be most of the measured time
+    from ytcm_utils import ytcm_logger
+    ytcm_logger.setLevel(logging.CRITICAL)
+    return root
+
+class BenchMessage:
+    """Chat message with the attributes of app.ytcm_ChatMessageCustom (app is not imported by the benchmarks)."""
+
+    def __init__(self, number, author=None):
+        self.author = author or f"author-{number % 500}"
+        self.text = f"Message number {number}, is this the right question?"
+        self.datetime = f"2025-01-01T00:00:00.{number:09d}Z"
+        self.is_male = True
+        self.show = True
+        self.raw_text = self.text
+        self.id = hashlib.sha256(f"{self.author}|{self.raw_text}".encode()).hexdigest()
+        self.is_question = True
+
+    def __str__(self):
+        return f"[{self.author}] - {self.raw_text}"
+
+def write_history(file_path, count):
+    """Write a messages file with a history of count messages (the format of every revision)."""
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump([dict(vars(BenchMessage(number))) for number in range(count)], f, ensure_ascii=False, indent=2)
+
+def merge_base(ref):
+    """Return the commit where HEAD forked from a branch (the tree before the changes of HEAD), None if unknown."""
+    result = subprocess.run(['git', 'merge-base', 'HEAD', ref], cwd=REPO_DIR, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+def run_revisions(script, revisions, args=()):
+    """Run a script once per revision, each in its own process (the modules are imported once per process).
+
+    Args:
+        script (str): Path of the script, which must accept --revision.
+        revisions (list): (label, revision) pairs, revision None = the working tree.
+        args (iterable): Other arguments of the script.
+    """
+    for label, revision in revisions:
+        print(f"== {label} ({revision or 'working tree'}) ==", flush=True)
+        subprocess.run([sys.executable, script, '--revision', revision or ''] + list(args), check=True)
@@ -0,0 +1,169 @@
+"""Stress test of the hide requests racing the background chat ingestion.
+
+The application runs in a sandbox with a fake YouTube reader (a busy chat re-sending its last
+messages at every read) and a fake OpenAI service, while the ingestion worker is woken up
+continuously and several clients hide visible messages through /ytcm_toggle_message_visibility.
+A checker compares the published snapshot with the hides already answered: a message whose hide
+request has completed must never be published as visible again. Exits with status 1 on any
+violation.
+
+    python bench/stress_hide_during_ingestion.py [--duration 10] [--hiders 8] [--page 50]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sandbox import enter_sandbox
+
+class FakeChatReader:
+    """YouTubeChatReader returning a page of the last messages of a busy chat at every read."""
+
+    def __init__(self, page_size, new_per_read=5):
+        self.live_chat_id = 'stress-chat'
+        self.connected = True
+        self.page_size = page_size
+        self.new_per_read = new_per_read
+        self._lock = threading.Lock()
+        self._messages = []
+        self.reads = 0
+
+    def get_live_chat_id(self):
+        return self.live_chat_id
+
+    def get_live_title(self):
+        return 'Stress live'
+
+    def get_new_messages(self):
+        with self._lock:
+            self.reads += 1
+            for _ in range(self.new_per_read):
+                number = len(self._messages)
+                self._messages.append({'author': f"author-{number % 50}", 'text': f"Stress message number {number}, can you read it?", 'published_at': f"2025-01-01T00:00:00.{number:09d}Z"})
+            # Already processed messages come back with the new ones, as with an overlapping page
+            return [dict(msg) for msg in self._messages[-self.page_size:]]
+
+class FakeAIService:
+    """OpenAIService approving every message, with a short delay to widen the race windows."""
+
+    DELAY_S = 0.002
+
+    def _result(self, text):
+        return {'is_question': True, 'is_appropriate': True, 'text': text, 'is_male': True}
+
+    async def classify_batch_async(self, messages, **kwargs):
+        await asyncio.sleep(self.DELAY_S)
+        return [self._result(msg['text']) for msg in messages]
+
+    async def analyze_async(self, text, author, **kwargs):
+        await asyncio.sleep(self.DELAY_S)
+        return self._result(text)
+
+    async def is_question_async(self, text):
+        await asyncio.sleep(self.DELAY_S)
+        return True
+
+    async def is_appropriate_async(self, text):
+        return True
+
+    async def correct_text_async(self, text):
+        return text
+
+    async def is_male_username_async(self, username):
+        return True
+
+    def close(self):
+        pass
+
+def visible_ids(app):
+    """Return the IDs of the messages published as visible."""
+    snapshot = app.ytcm_chat_event_broadcaster.get_snapshot()
+    if snapshot is None:
+        return set()
+    return {msg['id'] for msg in snapshot.payload.get('messages', []) if msg.get('id') and msg.get('show')}
+
+def run_stress(duration, hiders, page_size):
+    """Run the stress test.
+
+    Returns:
+        tuple: (chat reads, hides, checks, violations) counts.
+    """
+    import app
+    from data_bag import ytcm_data
+
+    ytcm_data.ytcm_tts_enabled = False
+    reader = FakeChatReader(page_size)
+    app.ytcm_youtube_chat_reader = reader
+    app.ytcm_openai_service = FakeAIService()
+
+    stop = threading.Event()
+    completed_lock = threading.Lock()
+    completed = set()
+    counts = {'hides': 0, 'checks': 0, 'violations': 0}
+
+    def drive():
+        while not stop.is_set():
+            app.ytcm_ingestion_worker.wake()
+            time.sleep(0.001)
+
+    def hide():
+        client = app.app.test_client()
+        while not stop.is_set():
+            candidates = list(visible_ids(app) - completed)
+            if not candidates:
+                time.sleep(0.001)
+                continue
+            message_id = random.choice(candidates)
+            response = client.post('/ytcm_toggle_message_visibility', json={'id': message_id, 'show': False})
+            if response.get_json().get('success'):
+                with completed_lock:
+                    completed.add(message_id)
+                    counts['hides'] += 1
+
+    def check():
+        while not stop.is_set():
+            # Hides answered before the snapshot is read must all be in it
+            with completed_lock:
+                hidden = set(completed)
+            violations = visible_ids(app) & hidden
+            counts['checks'] += 1
+            if violations:
+                counts['violations'] += len(violations)
+                print(f"Hidden messages published as visible: {sorted(violations)[:5]}", flush=True)
+
+    app.ytcm_ingestion_worker.start()
+    threads = [threading.Thread(target=drive, daemon=True), threading.Thread(target=check, daemon=True)]
+    threads += [threading.Thread(target=hide, daemon=True) for _ in range(hiders)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    app.ytcm_ingestion_worker.stop()
+    # The hidden IDs must also be the ones stored
+    not_stored = [message_id for message_id in completed if not app.ytcm_hidden_messages_manager.is_hidden(message_id)]
+    if not_stored:
+        print(f"Hidden messages not stored as hidden: {len(not_stored)}", flush=True)
+        counts['violations'] += len(not_stored)
+    return reader.reads, counts['hides'], counts['checks'], counts['violations']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=10, help="seconds of stress")
+    parser.add_argument('--hiders', type=int, default=8, help="concurrent clients hiding messages")
+    parser.add_argument('--page', type=int, default=50, help="messages returned by each chat read")
+    args = parser.parse_args()
+
+    enter_sandbox()
+    reads, hides, checks, violations = run_stress(args.duration, args.hiders, args.page)
+    print(f"chat reads: {reads}    hides: {hides}    checks: {checks}    violations: {violations}", flush=True)
+    sys.exit(1 if violations else 0)
+
+if __name__ == '__main__':
+    main()
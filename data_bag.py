@@ -1,8 +1,12 @@
 import os
+import sys
 from flask import request
 from ytcm_consts import *
 import json
+import time
+import threading
 from ytcm_utils import *
+from ytcm_write_behind import WriteBehind
 
 # Logging functions imported from ytcm_utils
 # info_log - For informational messages
@@ -13,7 +17,7 @@ Data persistence system with deep change monitoring
 
 This module implements a data persistence system that automatically monitors
 changes to nested data structures (lists and dictionaries) and triggers saving
-when they are modified. This allows automatic saving when an element
+when they are modified (saves are coalesced and written behind the changes). This allows automatic saving when an element
 of a dictionary contained in a list is modified through the singleton instance.
 
 Usage example:
@@ -161,15 +165,21 @@ class DataBag:
     
     This class holds various runtime states and configuration settings for the application.
     It is not persisted to disk directly but serves as the data model for StoredDataBag.
+    Volatile attributes (VOLATILE_ATTRIBUTES) hold runtime state: they are kept in memory only,
+    as plain values (never wrapped in observable wrappers) and never saved to disk.
     """
+    
+    # Runtime state and values derived from ytcm_consts.py, not persisted
+    VOLATILE_ATTRIBUTES = frozenset({'last_formatted_messages', 'ytcm_ai_needed', 'ytcm_tts_enabled', 'audio_file_dir_full_path'})
+    
     def __init__(self):
         """Initialize the DataBag with default values.
         
         Sets up runtime flags, configuration settings, and initializes message managers.
         """
         info_log("Initializing DataBag instance")
-        # Operation flags
-        self.ytcm_get_messages_in_progress = False
+        super().__setattr__('_volatile_values', {})
+        # Last messages sent to the clients
         self.last_formatted_messages = []
         
         # AI service configuration
@@ -183,6 +193,9 @@ class DataBag:
         self.channel_name = '...'
         self.ytcm_last_live_chat_id = None
         self.ytcm_live_chat_first_change = True
+        
+        # YouTube Data API quota used in the current quota day (see QuotaScheduler)
+        self.ytcm_yt_quota = {}
 
         info_log("DataBag initialization complete")
         
@@ -196,6 +209,11 @@ class DataBag:
             name: The name of the attribute to set
             value: The value to assign to the attribute
         """
+        if name in self.VOLATILE_ATTRIBUTES:
+            # Replacing a dict entry is atomic: readers see either the old or the new value
+            self._volatile_values[name] = value
+            return
+
         # Wraps the value if it's a list or dictionary
         # Note: we cannot pass the callback here because we don't have access to StoredDataBag._save
         # The wrappers will be reconfigured with the appropriate callback when loaded by StoredDataBag
@@ -207,11 +225,20 @@ class DataBag:
         # Assigns the (possibly wrapped) value to the attribute
         super().__setattr__(name, value)
 
+    def __getattr__(self, name):
+        """Returns the volatile attributes (called only for the attributes not found otherwise)."""
+        try:
+            return self.__dict__['_volatile_values'][name]
+        except KeyError:
+            raise AttributeError(name)
+
 class StoredDataBag:
     """Persistent data storage wrapper for DataBag.
     
     This class provides persistence for DataBag by saving and loading its state to/from a JSON file.
     It implements various Python special methods to make it behave like the underlying DataBag instance.
+    Reads are served from memory (the file is read again only when changed by someone else) and
+    changes only mark the bag dirty: a single snapshot is written behind them (see WriteBehind).
     """
 
     def __init__(self, file_path=os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), 'data')), 'ycm-data.json')):
@@ -226,9 +253,14 @@ class StoredDataBag:
         self._file_path = file_path
         self._save_enabled = True
         self._load_enabled = True
+        self._lock = threading.RLock()
+        # Saved on a timer only: building an observable list notifies once per element
+        self._writer = WriteBehind('data bag', self._save, threshold=sys.maxsize)
+        self._file_signature = None
+        self._file_checked_at = 0
         info_log("StoredDataBag initialization complete")
         self._ensure_directory_exists()
-        self._load()
+        self._load(force=True)
     
     def _ensure_directory_exists(self):
         """Ensure that the directory for the JSON file exists."""
@@ -239,118 +271,147 @@ class StoredDataBag:
         else:
             info_log(f"Directory already exists: {directory}")
     
+    def _get_file_signature(self):
+        """Return the modification time and size of the JSON file (None if it does not exist)."""
+        try:
+            stat = os.stat(self._file_path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+    
+    def _changed(self):
+        """Mark the bag dirty: called by the observable wrappers and by set()."""
+        # Changes made while a save is running are saved by the next one (only loads disable saving)
+        if self._save_enabled:
+            self._writer.mark_dirty()
+    
+    def flush(self):
+        """Write the pending changes to the JSON file now."""
+        self._writer.flush()
+    
+    @classmethod
+    def _plain_copy(cls, value):
+        """Return a copy of a value made of plain lists and dictionaries.
+
+        Each list or dictionary is copied in a single step, so the copy is consistent even if
+        another thread changes the data meanwhile (the observable wrappers do not take the lock).
+        """
+        if isinstance(value, dict):
+            return {key: cls._plain_copy(item) for key, item in dict(value).items()}
+        if isinstance(value, list):
+            return [cls._plain_copy(item) for item in list(value)]
+        return value
+    
     def _save(self):
         """Save data to the JSON file.
         
         Serializes saveable attributes of the DataBag instance to JSON format.
-        Only primitive types (int, float, str, list, dict, set, tuple, bool, None) are saved.
-        Complex objects like lists and dictionaries are checked recursively for serializability.
+        Only JSON serializable values are saved, each attribute is serialized once.
+        If the save fails, the bag is marked dirty again to retry it later.
         """
-        if not self._save_enabled:
-            return
-        self._save_enabled = False
-        self._load_enabled = False
-        try:
-            # Gets stack information to trace where the function was called from
-            import traceback
-            stack = traceback.extract_stack()
-            # Ignore the last two frames (this method and the callback)
-            caller_info = "unknown"
-            if len(stack) > 2:
-                frame = stack[-3]
-                caller_info = f"{frame.filename}:{frame.lineno} in {frame.name}"
-            
-            info_log(f"Saving data to file: {self._file_path} (called from: {caller_info})")
+        with self._lock:
+            if not self._save_enabled:
+                # Loading: the loaded data is already on disk
+                return
+            self._load_enabled = False
             try:
-                data_to_save = {}
-                
-                def is_json_serializable(obj):
-                    """Check if an object is JSON serializable."""
-                    if obj is None or isinstance(obj, (int, float, str, bool)):
-                        return True
-                    elif isinstance(obj, (list, tuple)):
-                        return all(is_json_serializable(item) for item in obj)
-                    elif isinstance(obj, dict):
-                        return all(isinstance(k, str) and is_json_serializable(v) for k, v in obj.items())
-                    elif isinstance(obj, set):
-                        return all(is_json_serializable(item) for item in obj)
-                    return False
-                
-                for attr_name in dir(self._data):
-                    # Skip private/special attributes and methods
-                    if attr_name.startswith('_') or callable(getattr(self._data, attr_name)):
-                        continue
+                info_log(f"Saving data to file: {self._file_path}")
+                try:
+                    serialized_attrs = []
+                    
+                    for attr_name, value in dict(vars(self._data)).items():
+                        # Skip private/special attributes and methods
+                        if attr_name.startswith('_') or callable(value):
+                            continue
                         
-                    value = getattr(self._data, attr_name)
+                        # Attributes that cannot be serialized are skipped
+                        try:
+                            serialized_attrs.append(f"{json.dumps(attr_name)}: {json.dumps(self._plain_copy(value), ensure_ascii=False)}")
+                        except (TypeError, ValueError):
+                            info_log(f"Skipping non-serializable attribute: {attr_name}")
                     
-                    # Check if the value is JSON serializable
-                    if is_json_serializable(value):
-                        data_to_save[attr_name] = value
-                    else:
-                        info_log(f"Skipping non-serializable attribute: {attr_name}")
-                
-                info_log(f"Saving {len(data_to_save)} attributes to file")
-                with open(self._file_path, 'w', encoding='utf-8') as f:
-                    json.dump(data_to_save, f, ensure_ascii=False, indent=2)
-                info_log("Data saved successfully")
-            except Exception as e:
-                err_log(f"Error saving data: {str(e)}")
-        finally:
-            self._save_enabled = True
-            self._load_enabled = True
-
-    def _load(self):
-        """Load data from the JSON file if it exists.
+                    info_log(f"Saving {len(serialized_attrs)} attributes to file")
+                    temp_path = self._file_path + '.tmp'
+                    with open(temp_path, 'w', encoding='utf-8') as f:
+                        f.write('{\n  ' + ',\n  '.join(serialized_attrs) + '\n}\n')
+                    os.replace(temp_path, self._file_path)
+                    # Own writes must not trigger a reload
+                    self._file_signature = self._get_file_signature()
+                    info_log("Data saved successfully")
+                except Exception as e:
+                    err_log(f"Error saving data: {str(e)}")
+                    # The pending changes were not saved: retried later
+                    self._writer.mark_dirty()
+            finally:
+                self._load_enabled = True
+
+    def _load(self, force=False):
+        """Load data from the JSON file if it exists and was changed since the last load or save.
         
         Deserializes the JSON data and updates the DataBag instance attributes.
         Only updates attributes that were previously saved and exist in the current DataBag instance.
         Ensures that lists and dictionaries are wrapped in their respective observable wrappers.
+        The file is checked at most every YTCM_STORE_FILE_CHECK_INTERVAL_S seconds and never
+        reloaded while changes are waiting to be saved.
+        
+        Args:
+            force: Read the file even if it did not change.
         """
-        if not self._load_enabled:
-            return
-        self._load_enabled = False
-        self._save_enabled = False
-        try:
-            info_log(f"Loading data from file: {self._file_path}")
+        if not force:
+            now = time.monotonic()
+            if now - self._file_checked_at < YTCM_STORE_FILE_CHECK_INTERVAL_S:
+                return
+            self._file_checked_at = now
+            if (self._get_file_signature() == self._file_signature) or self._writer.has_pending():
+                return
+        with self._lock:
+            if not self._load_enabled:
+                return
+            self._load_enabled = False
+            self._save_enabled = False
             try:
-                if os.path.exists(self._file_path):
-                    with open(self._file_path, 'r', encoding='utf-8') as f:
-                        saved_data = json.load(f)
-                        # Update only the properties that were saved and exist in the current instance
-                        loaded_count = 0
-                        for attr_name, value in saved_data.items():
-                            # Check if the attribute already exists in the DataBag instance
-                            if hasattr(self._data, attr_name):
-                                try:
-                                    # Wraps lists and dictionaries in observable wrappers with the appropriate callback
-                                    if isinstance(value, list):
-                                        value = ObservableList(value, callback=self._save)
-                                    elif isinstance(value, dict):
-                                        value = ObservableDict(value, callback=self._save)
-                                    
-                                    setattr(self._data, attr_name, value)
-                                    loaded_count += 1
-                                except Exception as attr_err:
-                                    err_log(f"Error setting attribute {attr_name}: {str(attr_err)}")
-                            else:
-                                info_log(f"Skipping unknown attribute: {attr_name}")
-                        info_log(f"Loaded {loaded_count} of {len(saved_data)} attributes from file")
-                        
-                        # Configures callbacks for all existing attributes
+                info_log(f"Loading data from file: {self._file_path}")
+                try:
+                    self._file_signature = self._get_file_signature()
+                    if os.path.exists(self._file_path):
+                        with open(self._file_path, 'r', encoding='utf-8') as f:
+                            saved_data = json.load(f)
+                            # Update only the properties that were saved and exist in the current instance
+                            loaded_count = 0
+                            for attr_name, value in saved_data.items():
+                                # Check if the attribute already exists in the DataBag instance (volatile ones saved by older versions are ignored)
+                                if (attr_name not in DataBag.VOLATILE_ATTRIBUTES) and hasattr(self._data, attr_name):
+                                    try:
+                                        # Wraps lists and dictionaries in observable wrappers with the appropriate callback
+                                        if isinstance(value, list):
+                                            value = ObservableList(value, callback=self._changed)
+                                        elif isinstance(value, dict):
+                                            value = ObservableDict(value, callback=self._changed)
+                                        
+                                        setattr(self._data, attr_name, value)
+                                        loaded_count += 1
+                                    except Exception as attr_err:
+                                        err_log(f"Error setting attribute {attr_name}: {str(attr_err)}")
+                                else:
+                                    info_log(f"Skipping unknown attribute: {attr_name}")
+                            info_log(f"Loaded {loaded_count} of {len(saved_data)} attributes from file")
+                            
+                            # Configures callbacks for all existing attributes
+                            self._configure_callbacks()
+                    else:
+                        info_log("Data file does not exist, using default values")
                         self._configure_callbacks()
-                else:
-                    info_log("Data file does not exist, using default values")
-            except Exception as e:
-                err_log(f"Error loading data: {str(e)}")
-        finally:
-            self._load_enabled = True
-            self._save_enabled = True
+                except Exception as e:
+                    err_log(f"Error loading data: {str(e)}")
+            finally:
+                self._load_enabled = True
+                self._save_enabled = True
             
     def _configure_callbacks(self):
         """Configures callbacks for all existing observable attributes.
         
         This method ensures that all ObservableList and ObservableDict objects
-        have the correct _save callback, even if they were created without a callback.
+        have the correct _changed callback, even if they were created without a callback.
         """
         for attr_name in dir(self._data):
             if attr_name.startswith('_') or callable(getattr(self._data, attr_name)):
@@ -358,7 +419,7 @@ class StoredDataBag:
                 
             value = getattr(self._data, attr_name)
             if isinstance(value, (ObservableList, ObservableDict)):
-                value.set_callback(self._save)
+                value.set_callback(self._changed)
             
     def get(self, var_name: str, default=None):
         """Get an attribute value from the DataBag instance.
@@ -371,27 +432,33 @@ class StoredDataBag:
             The attribute value or the default value if not found
         """
 #        info_log(f"Reading attribute: {var_name}")
+        if var_name in DataBag.VOLATILE_ATTRIBUTES:
+            return self._data._volatile_values.get(var_name, default)
         self._load()
         return getattr(self._data, var_name, default)
 
     def set(self, var_name: str, value):
-        """Set an attribute value in the DataBag instance and save to disk.
+        """Set an attribute value in the DataBag instance and schedule its saving to disk.
         
         Args:
             var_name: The name of the attribute to set
             value: The value to assign to the attribute
         """
 #        info_log(f"Setting attribute: {var_name}")
+        if var_name in DataBag.VOLATILE_ATTRIBUTES:
+            # Memory only: no observable wrapping, no saving
+            setattr(self._data, var_name, value)
+            return
         self._load()
         
         # Avvolge liste e dizionari in wrapper osservabili
         if isinstance(value, list):
-            value = ObservableList(value, callback=self._save)
+            value = ObservableList(value, callback=self._changed)
         elif isinstance(value, dict):
-            value = ObservableDict(value, callback=self._save)
+            value = ObservableDict(value, callback=self._changed)
             
         setattr(self._data, var_name, value)
-        self._save()
+        self._changed()
 
     def __getattr__(self, var_name):
         return self.get(var_name)
@@ -424,7 +491,7 @@ class StoredDataBag:
         return str(self._data)
 
     def __del__(self):
-        self._save()
+        self.flush()
 
 # Singleton pattern implementation
 class StoredDataBagSingleton:
@@ -479,6 +546,7 @@ def test_observable_collections():
         # Modify an element of the dictionary in the list
         # This should trigger automatic saving
         ytcm_data.test_list[0]["name"] = "Item 1 Modified"
+        ytcm_data.flush()
         
         info_log("Test completed successfully: modification of a dictionary in a list")
         return True
@@ -2,8 +2,12 @@ let lastNMessages = 0;
 let lastNMessagesFull = 0;
 let preventSingleClick = false;
 let pollingInterval;
+let messageStream = null;
+let messagesCursor = null;
 let apiQuotaErrMsg = false;
 let questionsOnly = 1; // Default value is 1 (on)
+let audioStatus = {}; // Message ID -> audio status (ready, pending, duration_s, url)
+let audioStatusTimer = null;
 
 // Function to set a cookie
 function setCookie(name, value, days) {
@@ -118,7 +122,7 @@ $(document).ready(function() {
                         // Start message polling
                         // Stop message polling
                         
-                        startMessagePolling();
+                        startMessageUpdates();
                     }
                 } else {
                     alert('Error during connection: ' + response.error);
@@ -143,7 +147,7 @@ $(document).ready(function() {
                     $('#message-list').empty();
                     
                     // Stop message polling
-                    stopMessagePolling();
+                    stopMessageUpdates();
                     
                     // Reload the page
                     location.reload();
@@ -186,19 +190,26 @@ $(document).ready(function() {
     
     // Function to fetch messages
     function fetchMessages() {
+        // Only the changes after the last received cursor are requested (empty 304 response if none)
         $.ajax({
             url: '/ytcm_get_messages',
             type: 'GET',
+            data: messagesCursor ? { since: messagesCursor } : {},
+            headers: messagesCursor ? { 'If-None-Match': '"' + messagesCursor + '"' } : {},
             success: function(response) {
-                if (response.success) {
-                    apiQuotaErrMsg = false;
-                    updateMessageList(response.messages);
-                } else if (response.error !== 'Not connected to YouTube') {
-                    console.log('Error retrieving messages:', response.error);
-                    if ((!apiQuotaErrMsg) && response.error.toLowerCase().includes('query')) {
-                        apiQuotaErrMsg = true;
-                        alert(response.error);
-                    }
+                if (!response) {
+                    // Not modified
+                    return;
+                }
+                if (response.events) {
+                    response.events.forEach(function(event) {
+                        applyMessageEvent(event.type, event.data);
+                    });
+                } else {
+                    handleMessagesResponse(response);
+                }
+                if (response.cursor) {
+                    messagesCursor = response.cursor;
                 }
             },
             error: function() {
@@ -207,6 +218,104 @@ $(document).ready(function() {
             }
         });
     }
+
+    // Function to handle a full messages list (polling response or stream snapshot)
+    function handleMessagesResponse(response) {
+        if (response.success) {
+            apiQuotaErrMsg = false;
+            updateMessageList(response.messages);
+        } else {
+            handleMessagesError(response.error);
+        }
+    }
+
+    // Function to report a messages retrieval error
+    function handleMessagesError(error) {
+        if (error !== 'Not connected to YouTube') {
+            console.log('Error retrieving messages:', error);
+            if ((!apiQuotaErrMsg) && error.toLowerCase().includes('query')) {
+                apiQuotaErrMsg = true;
+                alert(error);
+            }
+        }
+    }
+
+    // Function to start receiving messages: pushed by the server when possible, polled otherwise
+    function startMessageUpdates() {
+        if (window.EventSource) {
+            startMessageStream();
+        } else {
+            startMessagePolling();
+        }
+    }
+
+    // Function to stop receiving messages
+    function stopMessageUpdates() {
+        stopMessageStream();
+        stopMessagePolling();
+    }
+
+    // Function to open the message stream
+    function startMessageStream() {
+        stopMessageStream();
+
+        messageStream = new EventSource('/ytcm_stream');
+
+        messageStream.onopen = function() {
+            // The stream is (again) available, polling is no longer needed
+            stopMessagePolling();
+        };
+
+        messageStream.onerror = function() {
+            // Poll while the browser tries to reconnect (it resumes from the last event ID)
+            if (!pollingInterval) {
+                startMessagePolling();
+            }
+            if (messageStream && (messageStream.readyState === EventSource.CLOSED)) {
+                // The browser gave up, keep polling
+                messageStream = null;
+            }
+        };
+
+        ['snapshot', 'added', 'hidden', 'title', 'ingestion_error'].forEach(function(eventType) {
+            messageStream.addEventListener(eventType, function(e) {
+                applyMessageEvent(eventType, JSON.parse(e.data));
+                // Polling (if ever needed again) resumes from the last streamed event
+                messagesCursor = e.lastEventId;
+            });
+        });
+    }
+
+    // Function to apply a chat change received from the stream or from a delta response
+    function applyMessageEvent(eventType, data) {
+        if (eventType === 'snapshot') {
+            handleMessagesResponse(data);
+        } else if (eventType === 'added') {
+            apiQuotaErrMsg = false;
+            // The same message may come from both the stream and a delta response
+            $(`#message-list li[data-id="${data.id}"]`).remove();
+            $(`#message-list-full li[data-id="${data.id}"]`).remove();
+            appendMessage(data);
+            updateQuestionsButtonState();
+            scrollToNewMessages();
+            scheduleAudioStatusRefresh();
+        } else if (eventType === 'hidden') {
+            $(`#message-list li[data-id="${data.id}"]`).remove();
+            $(`#message-list-full li[data-id="${data.id}"]`).remove();
+        } else if (eventType === 'title') {
+            updateLiveTitle(data.live_title);
+        } else if (eventType === 'ingestion_error') {
+            handleMessagesError(data.error);
+        }
+    }
+
+    // Function to close the message stream
+    function stopMessageStream() {
+        if (messageStream) {
+            messageStream.close();
+            messageStream = null;
+        }
+    }
     
     // Function to update message list
     function updateMessageList(messages) {
@@ -231,189 +340,63 @@ $(document).ready(function() {
                     messageListFull.empty();
                     messageListCleared = true;
                 }
-                if (msg.show && (!(msg.show == 'false')) && (!(msg.show == 'False'))) {
-                    const listItem = $('<li class="list-group-item d-flex justify-content-between align-items-center"></li>');
-                    const listItemFull = $('<li class="list-group-item d-flex justify-content-between align-items-center"></li>');
-                    // Set the message ID as a data attribute
-                    listItem.attr('data-id', msg.id);
-                    listItem.attr('data-ismale', msg.is_male);
-                    listItem.attr('data-show', msg.show);
-                    listItem.attr('data-text', msg.text);
-                    listItem.attr('data-author', msg.author);
-                    listItem.attr('data-isquestion', msg.is_question);
-                    listItemFull.attr('data-id', msg.id);
-                    listItemFull.attr('data-ismale', msg.is_male);
-                    listItemFull.attr('data-show', msg.show);
-                    listItemFull.attr('data-text', msg.text);
-                    listItemFull.attr('data-author', msg.author);
-                    listItemFull.attr('data-isquestion', msg.is_question);
-                    
-                    // Create message text container
-                    const messageText = $('<div></div>');
-                    const messageTextFull = $('<div></div>');
-                    let msgText = msg.text;
-                    if (forceMsgUppercase) {
-                        msgText = msgText.toUpperCase();
-                    }
-                    const parsedText = parseYouTubeEmojisToHTML(msgText);
-                    let msgAuthor = msg.author;
-                    if (forceMsgUppercase) {
-                        msgAuthor = msgAuthor.toUpperCase();
-                    }
-                    messageText.html(`<span style="font-family: Verdana, Open Sans, Inter, sans-serif, monospace, system-ui;"><strong>[${msgAuthor}] - ${parsedText}</strong></span>`);
-                    messageTextFull.html(`<span style="font-family: Verdana, Open Sans, Inter, sans-serif, monospace, system-ui;"><strong>[${msgAuthor}] - ${parsedText}</strong></span>`);
-                    
-                    // Create toggle button
-                    const toggleBtn = $('<button class="btn btn-sm ms-2"></button>');
-                    const toggleBtnFull = $('<button class="btn btn-sm ms-2"></button>');
-                    toggleBtn.addClass(msg.show ? 'btn-outline-danger' : 'btn-outline-success');
-                    toggleBtn.html(msg.show ? '<i class="bi bi-eye-slash"></i>' : '<i class="bi bi-eye"></i>');
-                    toggleBtn.attr('title', msg.show ? 'Hide message' : 'Show message');
-                    // Make sure the click event doesn't propagate to the parent element in any case
-                    toggleBtn.on('click mousedown mouseup', function(e) {
-                        e.preventDefault();
-                        e.stopPropagation(); // Prevent triggering the list item click
-                        if (e.type === 'click') {
-                            toggleMessageVisibility(msg.id, !msg.show);
-                        }
-                        return false; // Additional security to stop propagation
-                    });
-
-                    toggleBtnFull.addClass(msg.show ? 'btn-outline-danger' : 'btn-outline-success');
-                    toggleBtnFull.html(msg.show ? '<i class="bi bi-eye-slash"></i>' : '<i class="bi bi-eye"></i>');
-                    toggleBtnFull.attr('title', msg.show ? 'Hide message' : 'Show message');
-                    // Make sure the click event doesn't propagate to the parent element in any case
-                    toggleBtnFull.on('click mousedown mouseup', function(e) {
-                        e.preventDefault();
-                        e.stopPropagation(); // Prevent triggering the list item click
-                        if (e.type === 'click') {
-                            toggleMessageVisibility(msg.id, !msg.show);
-                        }
-                        return false; // Additional security to stop propagation
-                    });
-                    
+                appendMessage(msg);
+            }
+        });
+        
+        updateQuestionsButtonState();
 
-                    // Add elements to list item
-                    listItem.append(messageText);
-                    listItem.append(toggleBtn);
-                    listItemFull.append(messageTextFull);
-                    listItemFull.append(toggleBtnFull);
+        scrollToNewMessages();
 
-                    // Variable to track click timing
-                    let clickTimer = null;
-                    
-                    // Add click event to show overlay (single click)
-                    listItem.click(function() {                   
-                        // Use a timer to differentiate between single and double click
-                        const $this = $(this);
-                        clickTimer = setTimeout(function() {
-                            clickTimer = null;
-                            showMessageOverlay(msg.author, msg.text, $this);
-                        }, 300); // 300ms delay to wait for potential double click
-                    });
-                    listItemFull.click(function() {                   
-                        // Use a timer to differentiate between single and double click
-                        const $this = $(this);
-                        clickTimer = setTimeout(function() {
-                            clickTimer = null;
-                            showMessageOverlay(msg.author, msg.text, $this);
-                        }, 300); // 300ms delay to wait for potential double click
-                    });
-                    
-                    // Add double click event to flash message and copy to clipboard
-                    listItem.dblclick(function(e) {
-                        e.preventDefault();
-                        e.stopPropagation();
-                        
-                        // Set flag to prevent single click
-                        preventSingleClick = true;
-                        
-                        // Clear the single click timer if it exists
-                        if (clickTimer) {
-                            clearTimeout(clickTimer);
-                            clickTimer = null;
-                        }
-                        
-                        // Reset the prevention flag after a short delay
-                        /* setTimeout(function() {
-                            preventSingleClick = false;
-                        }, 500); */
-                        
-                        // Add flash animation class
-                        listItem.addClass('message-flash');
-                        
-                        // Copy text to clipboard
-                        const textToCopy = `[${msg.author}] - ${msg.text}`;
-                        navigator.clipboard.writeText(textToCopy).then(function() {
-                            // Show temporary visual feedback
-                            const feedback = $('<span class="copy-feedback copy-success"><i class="bi bi-check"><i> Copied!</span>');
-                            listItem.append(feedback);
-                            
-                            // Remove flash class and feedback after animation completes
-                            setTimeout(function() {
-                                listItem.removeClass('message-flash');
-                                feedback.remove();
-                            }, 1500);
-                        }).catch(function(err) {
-                            console.log('Error during copy: ', err);
-                            listItem.append('<span class="copy-feedback copy-error"><i class="bi bi-exclamation-triangle"></i> Error during copy</span>');
-                            setTimeout(function() {
-                                listItem.removeClass('message-flash');
-                            }, 1500);
-                        });
-                    });
+        scheduleAudioStatusRefresh();
+    }
 
-                    listItemFull.dblclick(function(e) {
-                        e.preventDefault();
-                        e.stopPropagation();
-                        
-                        // Set flag to prevent single click
-                        preventSingleClick = true;
-                        
-                        // Clear the single click timer if it exists
-                        if (clickTimer) {
-                            clearTimeout(clickTimer);
-                            clickTimer = null;
-                        }
-                        
-                        // Reset the prevention flag after a short delay
-                        /* setTimeout(function() {
-                            preventSingleClick = false;
-                        }, 500); */
-                        
-                        // Add flash animation class
-                        listItemFull.addClass('message-flash');
-                        
-                        // Copy text to clipboard
-                        const textToCopy = `[${msg.author}] - ${msg.text}`;
-                        navigator.clipboard.writeText(textToCopy).then(function() {
-                            // Show temporary visual feedback
-                            const feedback = $('<span class="copy-feedback copy-success"><i class="bi bi-check"><i> Copied!</span>');
-                            listItemFull.append(feedback);
-                            
-                            // Remove flash class and feedback after animation completes
-                            setTimeout(function() {
-                                listItemFull.removeClass('message-flash');
-                                feedback.remove();
-                            }, 1500);
-                        }).catch(function(err) {
-                            console.log('Error during copy: ', err);
-                            listItemFull.append('<span class="copy-feedback copy-error"><i class="bi bi-exclamation-triangle"></i> Error during copy</span>');
-                            setTimeout(function() {
-                                listItemFull.removeClass('message-flash');
-                            }, 1500);
-                        });
-                    });
+    // Function to refresh (shortly after the last change) the audio status of the listed messages with a single request
+    function scheduleAudioStatusRefresh() {
+        if (typeof ytcm_tts_enabled !== 'undefined' && !ytcm_tts_enabled) {
+            return;
+        }
+        clearTimeout(audioStatusTimer);
+        audioStatusTimer = setTimeout(refreshAudioStatus, 1000);
+    }
 
-                    if (msg.is_question && (!(msg.is_question == 'false')) && (!(msg.is_question == 'False'))) {
-                        messageList.append(listItem);
+    function refreshAudioStatus() {
+        const ids = [];
+        $('#message-list-full li[data-id]').each(function() {
+            const messageId = $(this).attr('data-id');
+            if (!(audioStatus[messageId] && audioStatus[messageId].ready)) {
+                ids.push(messageId);
+            }
+        });
+        if (ids.length === 0) {
+            return;
+        }
+        
+        $.ajax({
+            url: '/ytcm_get_audio_status',
+            type: 'POST',
+            contentType: 'application/json',
+            data: JSON.stringify({ ids: ids }),
+            success: function(response) {
+                if (response.success) {
+                    Object.assign(audioStatus, response.audio);
+                    // Audio still being generated in the background: asked again later
+                    if (Object.values(response.audio).some(status => status.pending)) {
+                        scheduleAudioStatusRefresh();
                     }
-                    messageListFull.append(listItemFull);
                 }
+            },
+            error: function() {
+                console.log('Error checking audio status');
             }
         });
-        
-        updateQuestionsButtonState();
+    }
+
+    // Function to scroll to the bottom when the visible list has grown
+    function scrollToNewMessages() {
+
+        const messageList = $('#message-list');
+        const messageListFull = $('#message-list-full');
 
         if (questionsOnly !== 0) {
             let nMessages = messageList.children().length;
@@ -433,6 +416,193 @@ $(document).ready(function() {
             lastNMessagesFull = nMessages;
         }
     }
+
+    // Function to append a message to both lists
+    function appendMessage(msg) {
+
+        const messageList = $('#message-list');
+        const messageListFull = $('#message-list-full');
+
+        if (msg.show && (!(msg.show == 'false')) && (!(msg.show == 'False'))) {
+            const listItem = $('<li class="list-group-item d-flex justify-content-between align-items-center"></li>');
+            const listItemFull = $('<li class="list-group-item d-flex justify-content-between align-items-center"></li>');
+            // Set the message ID as a data attribute
+            listItem.attr('data-id', msg.id);
+            listItem.attr('data-ismale', msg.is_male);
+            listItem.attr('data-show', msg.show);
+            listItem.attr('data-text', msg.text);
+            listItem.attr('data-author', msg.author);
+            listItem.attr('data-isquestion', msg.is_question);
+            listItemFull.attr('data-id', msg.id);
+            listItemFull.attr('data-ismale', msg.is_male);
+            listItemFull.attr('data-show', msg.show);
+            listItemFull.attr('data-text', msg.text);
+            listItemFull.attr('data-author', msg.author);
+            listItemFull.attr('data-isquestion', msg.is_question);
+            
+            // Create message text container
+            const messageText = $('<div></div>');
+            const messageTextFull = $('<div></div>');
+            let msgText = msg.text;
+            if (forceMsgUppercase) {
+                msgText = msgText.toUpperCase();
+            }
+            const parsedText = parseYouTubeEmojisToHTML(msgText);
+            let msgAuthor = msg.author;
+            if (forceMsgUppercase) {
+                msgAuthor = msgAuthor.toUpperCase();
+            }
+            messageText.html(`<span style="font-family: Verdana, Open Sans, Inter, sans-serif, monospace, system-ui;"><strong>[${msgAuthor}] - ${parsedText}</strong></span>`);
+            messageTextFull.html(`<span style="font-family: Verdana, Open Sans, Inter, sans-serif, monospace, system-ui;"><strong>[${msgAuthor}] - ${parsedText}</strong></span>`);
+            
+            // Create toggle button
+            const toggleBtn = $('<button class="btn btn-sm ms-2"></button>');
+            const toggleBtnFull = $('<button class="btn btn-sm ms-2"></button>');
+            toggleBtn.addClass(msg.show ? 'btn-outline-danger' : 'btn-outline-success');
+            toggleBtn.html(msg.show ? '<i class="bi bi-eye-slash"></i>' : '<i class="bi bi-eye"></i>');
+            toggleBtn.attr('title', msg.show ? 'Hide message' : 'Show message');
+            // Make sure the click event doesn't propagate to the parent element in any case
+            toggleBtn.on('click mousedown mouseup', function(e) {
+                e.preventDefault();
+                e.stopPropagation(); // Prevent triggering the list item click
+                if (e.type === 'click') {
+                    toggleMessageVisibility(msg.id, !msg.show);
+                }
+                return false; // Additional security to stop propagation
+            });
+
+            toggleBtnFull.addClass(msg.show ? 'btn-outline-danger' : 'btn-outline-success');
+            toggleBtnFull.html(msg.show ? '<i class="bi bi-eye-slash"></i>' : '<i class="bi bi-eye"></i>');
+            toggleBtnFull.attr('title', msg.show ? 'Hide message' : 'Show message');
+            // Make sure the click event doesn't propagate to the parent element in any case
+            toggleBtnFull.on('click mousedown mouseup', function(e) {
+                e.preventDefault();
+                e.stopPropagation(); // Prevent triggering the list item click
+                if (e.type === 'click') {
+                    toggleMessageVisibility(msg.id, !msg.show);
+                }
+                return false; // Additional security to stop propagation
+            });
+            
+
+            // Add elements to list item
+            listItem.append(messageText);
+            listItem.append(toggleBtn);
+            listItemFull.append(messageTextFull);
+            listItemFull.append(toggleBtnFull);
+
+            // Variable to track click timing
+            let clickTimer = null;
+            
+            // Add click event to show overlay (single click)
+            listItem.click(function() {                   
+                // Use a timer to differentiate between single and double click
+                const $this = $(this);
+                clickTimer = setTimeout(function() {
+                    clickTimer = null;
+                    showMessageOverlay(msg.author, msg.text, $this);
+                }, 300); // 300ms delay to wait for potential double click
+            });
+            listItemFull.click(function() {                   
+                // Use a timer to differentiate between single and double click
+                const $this = $(this);
+                clickTimer = setTimeout(function() {
+                    clickTimer = null;
+                    showMessageOverlay(msg.author, msg.text, $this);
+                }, 300); // 300ms delay to wait for potential double click
+            });
+            
+            // Add double click event to flash message and copy to clipboard
+            listItem.dblclick(function(e) {
+                e.preventDefault();
+                e.stopPropagation();
+                
+                // Set flag to prevent single click
+                preventSingleClick = true;
+                
+                // Clear the single click timer if it exists
+                if (clickTimer) {
+                    clearTimeout(clickTimer);
+                    clickTimer = null;
+                }
+                
+                // Reset the prevention flag after a short delay
+                /* setTimeout(function() {
+                    preventSingleClick = false;
+                }, 500); */
+                
+                // Add flash animation class
+                listItem.addClass('message-flash');
+                
+                // Copy text to clipboard
+                const textToCopy = `[${msg.author}] - ${msg.text}`;
+                navigator.clipboard.writeText(textToCopy).then(function() {
+                    // Show temporary visual feedback
+                    const feedback = $('<span class="copy-feedback copy-success"><i class="bi bi-check"><i> Copied!</span>');
+                    listItem.append(feedback);
+                    
+                    // Remove flash class and feedback after animation completes
+                    setTimeout(function() {
+                        listItem.removeClass('message-flash');
+                        feedback.remove();
+                    }, 1500);
+                }).catch(function(err) {
+                    console.log('Error during copy: ', err);
+                    listItem.append('<span class="copy-feedback copy-error"><i class="bi bi-exclamation-triangle"></i> Error during copy</span>');
+                    setTimeout(function() {
+                        listItem.removeClass('message-flash');
+                    }, 1500);
+                });
+            });
+
+            listItemFull.dblclick(function(e) {
+                e.preventDefault();
+                e.stopPropagation();
+                
+                // Set flag to prevent single click
+                preventSingleClick = true;
+                
+                // Clear the single click timer if it exists
+                if (clickTimer) {
+                    clearTimeout(clickTimer);
+                    clickTimer = null;
+                }
+                
+                // Reset the prevention flag after a short delay
+                /* setTimeout(function() {
+                    preventSingleClick = false;
+                }, 500); */
+                
+                // Add flash animation class
+                listItemFull.addClass('message-flash');
+                
+                // Copy text to clipboard
+                const textToCopy = `[${msg.author}] - ${msg.text}`;
+                navigator.clipboard.writeText(textToCopy).then(function() {
+                    // Show temporary visual feedback
+                    const feedback = $('<span class="copy-feedback copy-success"><i class="bi bi-check"><i> Copied!</span>');
+                    listItemFull.append(feedback);
+                    
+                    // Remove flash class and feedback after animation completes
+                    setTimeout(function() {
+                        listItemFull.removeClass('message-flash');
+                        feedback.remove();
+                    }, 1500);
+                }).catch(function(err) {
+                    console.log('Error during copy: ', err);
+                    listItemFull.append('<span class="copy-feedback copy-error"><i class="bi bi-exclamation-triangle"></i> Error during copy</span>');
+                    setTimeout(function() {
+                        listItemFull.removeClass('message-flash');
+                    }, 1500);
+                });
+            });
+
+            if (msg.is_question && (!(msg.is_question == 'false')) && (!(msg.is_question == 'False'))) {
+                messageList.append(listItem);
+            }
+            messageListFull.append(listItemFull);
+        }
+    }
     
     // Function to toggle message visibility
     function toggleMessageVisibility(messageId, showValue) {
@@ -472,9 +642,9 @@ $(document).ready(function() {
         });
     }
     
-    // If already connected, start polling
+    // If already connected, start receiving messages
     if (isConnected) {
-        startMessagePolling();
+        startMessageUpdates();
     }
 // ================================================
 // ********** Message overlay management **********
@@ -545,75 +715,72 @@ $(document).ready(function() {
         // Remove any existing audio players
         $('#audio-container').remove();
         
-        // Check if an audio file already exists for this message
-        $.ajax({
-            url: '/ytcm_check_audio_file',
-            type: 'GET',
-            data: { id: messageId },
-            success: function(response) {
-                if (response.exists) {
-                    // The audio file exists, add the player
-                    addAudioPlayer(messageId);
-                } else {
-                    // The audio file does not exist, show the loading image
-                    $('.message-overlay-footer').prepend('<div id="audio-container"><img src="/static/images/loading-bar.gif" alt="Loading..." style="height: 40px;"></div>');
-                    
-                    // Request the generation of the audio file with retry mechanism
-                    let retryCount = 0;
-                    const maxRetries = 3;
-                    
-                    function generateAudio() {
-                        $.ajax({
-                            url: '/ytcm_generate_audio',
-                            type: 'POST',
-                            contentType: 'application/json',
-                            data: JSON.stringify({
-                                id: messageId,
-                                text: text,
-                                is_male: isMale
-                            }),
-                            success: function(genResponse) {
-                                if (genResponse.success) {
-                                    // Replace the loading image with the audio player
-                                    addAudioPlayer(messageId);
-                                } else {
-                                    // Retry if we haven't reached max retries
-                                    if (retryCount < maxRetries) {
-                                        retryCount++;
-                                        $('#audio-container').html(`<div class="audio-loading">Attempt ${retryCount}/${maxRetries}...</div>`);
-                                        setTimeout(generateAudio, 1000); // Wait 1 second before retrying
-                                    } else {
-                                        // Show an error message after all retries failed
-                                        $('#audio-container').html('<div class="audio-error">Error generating audio</div>');
-                                    }
-                                }
-                            },
-                            error: function() {
-                                // Retry if we haven't reached max retries
-                                if (retryCount < maxRetries) {
-                                    retryCount++;
-                                    $('#audio-container').html(`<div class="audio-loading">Attempt ${retryCount}/${maxRetries}...</div>`);
-                                    setTimeout(generateAudio, 1000); // Wait 1 second before retrying
-                                } else {
-                                    // Show an error message after all retries failed
-                                    $('#audio-container').html('<div class="audio-error">Error generating audio</div>');
-                                }
-                            }
-                        });
+        // Audio already generated (known from the batch status): played from the cache
+        if (audioStatus[messageId] && audioStatus[messageId].ready) {
+            addAudioPlayer(messageId, function() {
+                // Status out of date (e.g. live chat changed): generated again
+                delete audioStatus[messageId];
+                checkAndAddAudioPlayer(messageId, text, isMale);
+            });
+            return;
+        }
+        
+        // Request the generation of the audio file with retry mechanism
+        let retryCount = 0;
+        const maxRetries = 3;
+        
+        function generateAudio() {
+            $.ajax({
+                url: '/ytcm_generate_audio',
+                type: 'POST',
+                contentType: 'application/json',
+                data: JSON.stringify({
+                    id: messageId,
+                    text: text,
+                    is_male: isMale
+                }),
+                success: function(genResponse) {
+                    if (genResponse.success) {
+                        // Replace the loading image with the audio player
+                        addAudioPlayer(messageId);
+                    } else {
+                        // Retry if we haven't reached max retries
+                        if (retryCount < maxRetries) {
+                            retryCount++;
+                            $('#audio-container').html(`<div class="audio-loading">Attempt ${retryCount}/${maxRetries}...</div>`);
+                            setTimeout(generateAudio, 1000); // Wait 1 second before retrying
+                        } else {
+                            // Show an error message after all retries failed
+                            $('#audio-container').html('<div class="audio-error">Error generating audio</div>');
+                        }
+                    }
+                },
+                error: function() {
+                    // Retry if we haven't reached max retries
+                    if (retryCount < maxRetries) {
+                        retryCount++;
+                        $('#audio-container').html(`<div class="audio-loading">Attempt ${retryCount}/${maxRetries}...</div>`);
+                        setTimeout(generateAudio, 1000); // Wait 1 second before retrying
+                    } else {
+                        // Show an error message after all retries failed
+                        $('#audio-container').html('<div class="audio-error">Error generating audio</div>');
                     }
-                    
-                    // Start the generation process
-                    generateAudio();
                 }
-            },
-            error: function() {
-                console.log('Error checking audio file');
-            }
+            });
+        }
+        
+        // Otherwise streamed while synthesized (or served once generated in the background),
+        // the generation request (with the loading image) is the fallback
+        addAudioPlayer(messageId, function() {
+            $('#audio-container').remove();
+            $('.message-overlay-footer').prepend('<div id="audio-container"><img src="/static/images/loading-bar.gif" alt="Loading..." style="height: 40px;"></div>');
+            generateAudio();
         });
     }
     
     // Function to add the audio player
-    function addAudioPlayer(messageId) {
+    // (the audio not generated yet is streamed while synthesized from the stored message, onError is called if it fails)
+    function addAudioPlayer(messageId, onError) {
         // Check if TTS is enabled
         if (typeof ytcm_tts_enabled !== 'undefined' && !ytcm_tts_enabled) {
             // Remove any existing audio players
@@ -624,10 +791,12 @@ $(document).ready(function() {
         // Remove any existing audio players before adding a new one
         $('#audio-container').remove();
         
+        const audioUrl = `/ytcm_audio/${messageId}.mp3`;
+        
         const audioHtml = `
             <div id="audio-container">
                 <audio controls>
-                    <source src="${YTCM_TTS_AUDIO_FILES_DIR}${messageId}.mp3" type="audio/mpeg">
+                    <source src="${audioUrl}" type="audio/mpeg">
                     Your browser does not support the audio element.
                 </audio>
             </div>
@@ -635,6 +804,10 @@ $(document).ready(function() {
         
         // Add the player at the beginning of the footer
         $('.message-overlay-footer').prepend(audioHtml);
+        
+        if (onError) {
+            $('#audio-container source').on('error', onError);
+        }
     }
 
 });
@@ -0,0 +1,195 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from ytcm_consts import *
+from ytcm_utils import *
+from ytcm_write_behind import WriteBehind
+
+class AIVerdictCache:
+    """Durable cache of the AI verdicts, saved in a local SQLite database.
+
+    Author gender verdicts are keyed by username, question/moderation/correction verdicts by the
+    hash of the normalized text plus model (and target language for the corrections), so the same
+    text or the same author is never sent to OpenAI twice. The corrections are rewritten texts:
+    only their spacing is normalized, so a text is never shown with the casing of another one.
+    The least recently used entries are evicted when the cache grows beyond max_entries.
+
+    The cache is used from the coroutines of the shared event loop: new verdicts and last use
+    times are kept in memory and written to the database by a WriteBehind timer thread, so a
+    lookup only reads.
+    """
+
+    def __init__(self, file_path=os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), 'data')), 'ycm-ai_cache.sqlite3'), max_entries=YTCM_AI_CACHE_MAX_ENTRIES):
+        """Initialize the cache.
+
+        Args:
+            file_path (str): Path of the SQLite database file.
+            max_entries (int): Maximum number of verdicts kept (0 = cache disabled).
+        """
+        info_log(f"Initializing AIVerdictCache with file: {file_path}")
+
+        self.file_path = file_path
+        self.max_entries = max_entries
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+        self._connection = None
+        self._write_connection = None
+        self._entries = 0
+        self._pending_values = {}  # key -> JSON verdict not written yet
+        self._pending_uses = {}  # key -> last use time not written yet
+        self._writing_values = {}  # verdicts being written by _save(), still read from here
+        self._writer = WriteBehind('AI verdict cache', self._save)
+
+        if self.max_entries <= 0:
+            info_log("AI verdict cache disabled")
+            return
+
+        try:
+            directory = os.path.dirname(os.path.abspath(self.file_path))
+            if not os.path.exists(directory):
+                info_log(f"Creating directory: {directory}")
+                os.makedirs(directory)
+            self._connection = sqlite3.connect(self.file_path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS verdicts_last_used ON verdicts (last_used)")
+            self._connection.commit()
+            self._entries = self._connection.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+            info_log(f"Loaded AI verdict cache with {self._entries} entries")
+        except Exception as e:
+            err_log(f"Error opening AI verdict cache, cache disabled: {str(e)}")
+            self._connection = None
+
+    @staticmethod
+    def text_key(kind, text, model, language=None):
+        """Build the key of a verdict about a text.
+
+        Args:
+            kind (str): Verdict kind ('question', 'moderation', 'correction').
+            text (str): The analyzed text (spacing is normalized, and case except for the corrections).
+            model (str): The model giving the verdict.
+            language (str): Target language of the verdict, if any.
+
+        Returns:
+            str: The cache key.
+        """
+        normalized_text = re.sub(r'\s+', ' ', text).strip()
+        if kind != 'correction':
+            normalized_text = normalized_text.lower()
+        text_hash = hashlib.sha256(normalized_text.encode()).hexdigest()
+        return f"{kind}|{model}|{language or ''}|{text_hash}"
+
+    @staticmethod
+    def author_key(author, model):
+        """Build the key of the gender verdict about a username."""
+        return f"gender|{model}|{author}"
+
+    def get(self, key):
+        """Return the cached verdict for the key.
+
+        Args:
+            key (str): Key built with text_key() or author_key().
+
+        Returns:
+            The cached verdict, None if not cached.
+        """
+        if not self._connection:
+            return None
+        kind = key.split('|', 1)[0]
+        try:
+            with self._lock:
+                value = self._pending_values.get(key) or self._writing_values.get(key)
+                if value is None:
+                    row = self._connection.execute("SELECT value FROM verdicts WHERE key = ?", (key,)).fetchone()
+                    value = row[0] if row else None
+                if value is None:
+                    self.misses[kind] = self.misses.get(kind, 0) + 1
+                    return None
+                self.hits[kind] = self.hits.get(kind, 0) + 1
+                # The last use time is written later, with the other changes
+                if key not in self._pending_values:
+                    self._pending_uses[key] = time.time()
+            self._writer.mark_dirty()
+            return json.loads(value)
+        except Exception as e:
+            err_log(f"Error reading AI verdict cache: {str(e)}")
+            return None
+
+    def set(self, key, value):
+        """Save a verdict (written to the database by the write-behind thread).
+
+        Args:
+            key (str): Key built with text_key() or author_key().
+            value: JSON serializable verdict.
+        """
+        if not self._connection:
+            return
+        try:
+            with self._lock:
+                self._pending_values[key] = json.dumps(value, ensure_ascii=False)
+                self._pending_uses.pop(key, None)
+            self._writer.mark_dirty()
+        except Exception as e:
+            err_log(f"Error writing AI verdict cache: {str(e)}")
+
+    def flush(self):
+        """Write the pending verdicts and last use times to the database now."""
+        self._writer.flush()
+
+    def _save(self):
+        """Write the pending changes, evicting the least recently used verdicts if the cache is full (WriteBehind callback)."""
+        with self._lock:
+            values, self._pending_values = self._pending_values, {}
+            uses, self._pending_uses = self._pending_uses, {}
+            self._writing_values = values
+        try:
+            # Own connection, without the lock: the lookups go on reading (WAL) while it writes
+            if self._write_connection is None:
+                self._write_connection = sqlite3.connect(self.file_path, check_same_thread=False)
+            connection = self._write_connection
+            now = time.time()
+            try:
+                connection.executemany("INSERT OR REPLACE INTO verdicts (key, value, last_used) VALUES (?, ?, ?)", [(key, value, now) for key, value in values.items()])
+                connection.executemany("UPDATE verdicts SET last_used = ? WHERE key = ?", [(used, key) for key, used in uses.items()])
+                entries = connection.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+                if entries > self.max_entries:
+                    # Evict a tenth of the cache at once, so eviction does not run at every write
+                    connection.execute("DELETE FROM verdicts WHERE key IN (SELECT key FROM verdicts ORDER BY last_used LIMIT ?)", (entries - int(self.max_entries * 0.9),))
+                    entries = connection.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+                    info_log(f"AI verdict cache evicted down to {entries} entries")
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            with self._lock:
+                self._entries = entries
+        except Exception:
+            # Kept for the next save, unless changed meanwhile
+            with self._lock:
+                for key, value in values.items():
+                    self._pending_values.setdefault(key, value)
+                for key, used in uses.items():
+                    self._pending_uses.setdefault(key, used)
+            self._writer.mark_dirty(len(values) + len(uses))
+            raise
+        finally:
+            with self._lock:
+                self._writing_values = {}
+
+    def get_stats(self):
+        """Return the cache counters.
+
+        Returns:
+            dict: 'entries', 'hits' and 'misses' (the last two per verdict kind).
+        """
+        with self._lock:
+            return {'entries': self._entries, 'hits': dict(self.hits), 'misses': dict(self.misses)}
+
+# Create an instance of the cache for global use
+ytcm_ai_cache = AIVerdictCache()
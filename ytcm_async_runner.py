@@ -0,0 +1,57 @@
+import asyncio
+import threading
+from ytcm_utils import *
+
+class AsyncRunner:
+    """Runs an asyncio event loop in a background thread, shared by the whole application.
+
+    The Flask views and the ingestion worker are synchronous: they submit coroutines to this loop
+    and wait for (or cancel) the returned concurrent futures. All the awaitable API calls share the
+    same loop, so many requests can be in flight without one OS thread per request.
+    """
+
+    def __init__(self):
+        """Initialize the runner, the loop thread is started at the first submission."""
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def get_loop(self):
+        """Return the event loop, starting its thread if needed.
+
+        Returns:
+            asyncio.AbstractEventLoop: The shared event loop.
+        """
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='ytcm-async', daemon=True)
+                self._thread.start()
+                info_log("Async runner event loop started")
+            return self._loop
+
+    def submit(self, coroutine):
+        """Schedule a coroutine on the shared loop.
+
+        Args:
+            coroutine: The coroutine to run.
+
+        Returns:
+            concurrent.futures.Future: Future of the coroutine result, cancelling it cancels the coroutine.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.get_loop())
+
+    def run(self, coroutine, timeout=None):
+        """Run a coroutine on the shared loop and wait for its result.
+
+        Args:
+            coroutine: The coroutine to run.
+            timeout (float): Seconds to wait for the result (None = no limit).
+
+        Returns:
+            The coroutine result.
+        """
+        return self.submit(coroutine).result(timeout)
+
+# Create an instance of the runner for global use
+ytcm_async_runner = AsyncRunner()
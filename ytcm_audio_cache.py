@@ -0,0 +1,288 @@
+import os
+import re
+import hashlib
+import threading
+import collections
+from ytcm_consts import *
+from ytcm_utils import *
+
+class AudioCache:
+    """Content-addressed cache of the TTS audio files.
+
+    Each file is named by the hash of what was synthesized (cleaned text, voice, format), so the
+    same text read by the same voice is synthesized only once, whatever the message it belongs to.
+    Messages are mapped onto the cache entries in memory; the entries themselves stay on disk
+    across restarts and live chat changes, and the least recently used ones are evicted when the
+    cache grows beyond YTCM_TTS_CACHE_MAX_BYTES or YTCM_TTS_CACHE_MAX_ENTRIES. The keys being
+    synthesized are tracked too, so concurrent requests for the same audio wait for one synthesis.
+    """
+
+    _ENTRY_FILE_NAME = re.compile(r'^[0-9a-f]{64}\.mp3$')
+    # Polly MP3 audio at 24000 Hz is encoded at 48 kbps: used to estimate the durations
+    _MP3_BYTES_PER_SECOND = 48000 / 8
+
+    def __init__(self, directory=os.path.abspath(os.path.join(os.path.dirname(__file__), YTCM_TTS_AUDIO_FILES_DIR)), max_bytes=YTCM_TTS_CACHE_MAX_BYTES, max_entries=YTCM_TTS_CACHE_MAX_ENTRIES):
+        """Initialize the cache, indexing the entries already on disk.
+
+        Args:
+            directory (str): Directory of the audio files.
+            max_bytes (int): Maximum total size of the entries.
+            max_entries (int): Maximum number of entries.
+        """
+        info_log(f"Initializing AudioCache in directory: {directory}")
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # Notified (with _lock held) when a synthesis ends
+        self._synthesis_done = threading.Condition(self._lock)
+        self._synthesizing = set()
+        self._entries = collections.OrderedDict()  # key -> size in bytes, least recently used first
+        self._total_bytes = 0
+        self._message_keys = {}  # message ID -> key
+        self.hits = 0
+        self.misses = 0
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            files = []
+            for filename in os.listdir(self.directory):
+                if filename.endswith('.tmp'):
+                    # Left by an interrupted generation
+                    os.remove(os.path.join(self.directory, filename))
+                elif self.is_entry_file(filename):
+                    stat = os.stat(os.path.join(self.directory, filename))
+                    files.append((stat.st_mtime, filename[:-4], stat.st_size))
+            # The modification time of an entry is its last use
+            for mtime, key, size in sorted(files):
+                self._entries[key] = size
+                self._total_bytes += size
+            info_log(f"Loaded {len(self._entries)} audio cache entries ({self._total_bytes} bytes)")
+        except Exception as e:
+            err_log(f"Error loading audio cache: {str(e)}")
+
+    @classmethod
+    def is_entry_file(cls, filename):
+        """Check if a file name is the one of a cache entry."""
+        return bool(cls._ENTRY_FILE_NAME.match(filename))
+
+    @staticmethod
+    def make_key(text, voice, output_format='mp3', sample_rate='24000'):
+        """Build the key of the audio of a text.
+
+        Args:
+            text (str): The text sent to the TTS service.
+            voice (str): The voice ID.
+            output_format (str): The audio format.
+            sample_rate (str): The audio sample rate.
+
+        Returns:
+            str: The cache key.
+        """
+        return hashlib.sha256(f"{voice}|{output_format}|{sample_rate}|{text}".encode()).hexdigest()
+
+    def entry_path(self, key):
+        """Return the path of the file of a cache entry."""
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def temp_path(self, key):
+        """Return a path where the current thread can write the file of an entry before add_file()."""
+        os.makedirs(self.directory, exist_ok=True)
+        return f"{self.entry_path(key)}.{threading.get_ident()}.tmp"
+
+    def get(self, key):
+        """Return the path of a cache entry, marking it as recently used.
+
+        Args:
+            key (str): Key built with make_key().
+
+        Returns:
+            str: The file path, None if the entry is not cached.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+        path = self.entry_path(key)
+        try:
+            os.utime(path)
+            return path
+        except OSError:
+            # Deleted from the outside
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+            return None
+
+    def put(self, key, data):
+        """Save audio data as a cache entry.
+
+        Args:
+            key (str): Key built with make_key().
+            data (bytes): The audio data.
+
+        Returns:
+            str: The file path.
+        """
+        temp_path = self.temp_path(key)
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        return self.add_file(key, temp_path)
+
+    def add_file(self, key, file_path):
+        """Move a complete audio file into the cache.
+
+        Args:
+            key (str): Key built with make_key().
+            file_path (str): The file to move (in the cache directory, so the move is atomic).
+
+        Returns:
+            str: The path of the entry.
+        """
+        path = self.entry_path(key)
+        os.replace(file_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._total_bytes += size - self._entries.get(key, 0)
+            self._entries[key] = size
+            self._entries.move_to_end(key)
+            self._evict(key)
+        return path
+
+    def _evict(self, keep_key):
+        """Delete the least recently used entries beyond the limits (call with the lock held)."""
+        evicted = 0
+        while ((self._total_bytes > self.max_bytes) or (len(self._entries) > self.max_entries)) and (len(self._entries) > 1):
+            key = next(iter(self._entries))
+            if key == keep_key:
+                break
+            self._total_bytes -= self._entries.pop(key)
+            evicted += 1
+            try:
+                os.remove(self.entry_path(key))
+            except OSError as e:
+                err_log(f"Error deleting audio cache entry {key}: {str(e)}")
+        if evicted:
+            info_log(f"Audio cache evicted {evicted} entries ({len(self._entries)} entries, {self._total_bytes} bytes left)")
+
+    def start_synthesis(self, key):
+        """Mark an entry as being synthesized by the caller, which must call end_synthesis() afterwards.
+
+        Args:
+            key (str): Key built with make_key().
+
+        Returns:
+            bool: True if the caller must synthesize the entry, False if it is cached or being synthesized.
+        """
+        with self._lock:
+            if (key in self._entries) or (key in self._synthesizing):
+                return False
+            self._synthesizing.add(key)
+            return True
+
+    def end_synthesis(self, key):
+        """Mark the end (successful or not) of the synthesis of an entry, waking up the waiting requests."""
+        with self._lock:
+            self._synthesizing.discard(key)
+            self._synthesis_done.notify_all()
+
+    def wait_synthesis(self, key, timeout):
+        """Wait for the end of the synthesis of an entry, if any.
+
+        Args:
+            key (str): Key built with make_key().
+            timeout (float): Maximum seconds to wait.
+
+        Returns:
+            bool: False if the entry is still being synthesized after timeout seconds.
+        """
+        with self._lock:
+            return self._synthesis_done.wait_for(lambda: key not in self._synthesizing, timeout)
+
+    def link_message(self, message_id, key):
+        """Map a message onto a cache entry."""
+        with self._lock:
+            self._message_keys[message_id] = key
+
+    def discard_message(self, message_id):
+        """Forget the audio of a message, deleting its entry if no other message uses it.
+
+        Args:
+            message_id (str): ID of the message.
+
+        Returns:
+            bool: True if the entry was deleted.
+        """
+        with self._lock:
+            key = self._message_keys.pop(message_id, None)
+            if (key is None) or (key in self._synthesizing) or (key in self._message_keys.values()):
+                return False
+            size = self._entries.pop(key, None)
+            if size is None:
+                return False
+            self._total_bytes -= size
+        try:
+            os.remove(self.entry_path(key))
+        except OSError as e:
+            err_log(f"Error deleting audio cache entry {key}: {str(e)}")
+        return True
+
+    def get_message_key(self, message_id):
+        """Return the key of the entry of a message, None if the message has no audio."""
+        with self._lock:
+            return self._message_keys.get(message_id)
+
+    def get_message_path(self, message_id):
+        """Return the audio file of a message.
+
+        Args:
+            message_id (str): ID of the message.
+
+        Returns:
+            str: The file path, None if the message has no (cached) audio.
+        """
+        key = self.get_message_key(message_id)
+        return self.get(key) if key else None
+
+    def get_messages_status(self, message_ids):
+        """Return the audio status of many messages, from memory only (no file system access).
+
+        Args:
+            message_ids (list): IDs of the messages.
+
+        Returns:
+            dict: Message ID -> dict with 'ready' (bool) and 'duration_s' (estimated seconds, None if not ready).
+        """
+        status = {}
+        with self._lock:
+            for message_id in message_ids:
+                size = self._entries.get(self._message_keys.get(message_id))
+                status[message_id] = {'ready': size is not None, 'duration_s': round(size / self._MP3_BYTES_PER_SECOND, 1) if size is not None else None}
+        return status
+
+    def forget_messages(self):
+        """Forget the message mappings (the audio entries stay cached).
+
+        Returns:
+            int: Number of mappings forgotten.
+        """
+        with self._lock:
+            count = len(self._message_keys)
+            self._message_keys = {}
+        return count
+
+    def get_stats(self):
+        """Return the cache counters.
+
+        Returns:
+            dict: 'entries', 'bytes', 'messages', 'synthesizing', 'hits' and 'misses'.
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._total_bytes, 'messages': len(self._message_keys), 'synthesizing': len(self._synthesizing), 'hits': self.hits, 'misses': self.misses}
+
+# Create an instance of the cache for global use
+ytcm_audio_cache = AudioCache()
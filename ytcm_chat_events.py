@@ -0,0 +1,202 @@
+import collections
+import json
+import threading
+import time
+from ytcm_consts import *
+from ytcm_utils import *
+
+class ChatSnapshot:
+    """Immutable state of the chat list published at a given version (the ID of the last event it includes).
+
+    Snapshots are never modified: a change publishes a new snapshot that shares the unchanged
+    messages with the previous one (copy-on-write), so readers use them without copying and the
+    JSON response is serialized at most once per version.
+    """
+
+    __slots__ = ('version', 'payload', '_json_bytes')
+
+    def __init__(self, version, payload):
+        """Initialize the snapshot.
+
+        Args:
+            version (str): ID of the last event included in the snapshot.
+            payload (dict): Response payload, must not be modified afterwards.
+        """
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'payload', payload)
+        object.__setattr__(self, '_json_bytes', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ChatSnapshot is immutable")
+
+    def json_bytes(self):
+        """Return the JSON response body of the snapshot (the payload plus the 'cursor'), cached."""
+        if self._json_bytes is None:
+            object.__setattr__(self, '_json_bytes', json.dumps(dict(self.payload, cursor=self.version), ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        return self._json_bytes
+
+class ChatEventBroadcaster:
+    """Turns the ingestion results into chat events and fans them out to all the stream clients.
+
+    Every published payload is compared with the previous one (kept as a ChatSnapshot) and only
+    the differences are recorded as events:
+        - 'added': a new visible message (data: the formatted message)
+        - 'hidden': a message was hidden (data: {'id': ...})
+        - 'title': the live title changed (data: {'live_title': ...})
+        - 'ingestion_error': the ingestion failed (data: {'error': ...})
+        - 'snapshot': the list changed in a way that is not an addition (data: the whole payload)
+    The last YTCM_STREAM_EVENT_HISTORY events are kept, so a client that reconnects with its
+    last event ID receives only what it missed.
+    """
+
+    def __init__(self, history_size=YTCM_STREAM_EVENT_HISTORY):
+        """Initialize the broadcaster.
+
+        Args:
+            history_size (int): Number of events kept for the clients that reconnect.
+        """
+        # Event IDs are "<epoch>-<sequence>", IDs received from a previous process are never resumed
+        self._epoch = str(int(time.time()))
+        self._sequence = 0
+        self._events = collections.deque(maxlen=history_size)
+        self._condition = threading.Condition()
+        self._snapshot = None
+        self._last_error = None
+        info_log(f"Initialized ChatEventBroadcaster (epoch {self._epoch})")
+
+    def _event_id(self, sequence):
+        return f"{self._epoch}-{sequence}"
+
+    def _parse_event_id(self, event_id):
+        """Return the sequence number of an event ID of this process, None otherwise."""
+        try:
+            epoch, sequence = str(event_id).split('-', 1)
+            if epoch == self._epoch:
+                return int(sequence)
+        except (ValueError, TypeError):
+            pass
+        return None
+
+    def _append(self, event_type, data):
+        self._sequence += 1
+        self._events.append((self._sequence, event_type, data))
+
+    def publish(self, payload):
+        """Record the differences between the given payload and the previous one and wake up the clients.
+
+        Args:
+            payload (dict): Response payload produced by the ingestion cycle.
+        """
+        with self._condition:
+            first_sequence = self._sequence
+            previous = self._snapshot.payload if self._snapshot else None
+
+            if not payload.get('success'):
+                # Clients keep showing the last good list, the same error is notified only once
+                if payload.get('error') != self._last_error:
+                    self._last_error = payload.get('error')
+                    self._append('ingestion_error', {'error': self._last_error})
+            else:
+                self._last_error = None
+                old_messages = [m for m in previous.get('messages', []) if m.get('id')] if previous else []
+                new_messages = [m for m in payload.get('messages', []) if m.get('id')]
+                new_titles = [m for m in payload.get('messages', []) if m.get('live_title')]
+                new_ids = {m['id'] for m in new_messages}
+                old_by_id = {m['id']: m for m in old_messages}
+
+                if previous is None or any(msg_id not in new_ids for msg_id in old_by_id):
+                    # Messages were removed (cleared list, new live chat...): resend everything
+                    self._append('snapshot', payload)
+                else:
+                    if new_titles and (new_titles[0].get('live_title') != self._live_title(previous)):
+                        self._append('title', {'live_title': new_titles[0].get('live_title')})
+                    for msg in new_messages:
+                        old_msg = old_by_id.get(msg['id'])
+                        if old_msg is None:
+                            if msg.get('show'):
+                                self._append('added', msg)
+                        elif old_msg.get('show') and (not msg.get('show')):
+                            self._append('hidden', {'id': msg['id']})
+                    if not new_titles:
+                        # Keep the title known by the clients for the next comparison
+                        title = self._live_title(previous)
+                        if title:
+                            payload = dict(payload, messages=[{'live_title': title}] + payload.get('messages', []))
+
+                # Without events the clients already have this state: the previous snapshot (and its serialization) is kept
+                if (self._snapshot is None) or (self._sequence != first_sequence):
+                    self._snapshot = ChatSnapshot(self._event_id(self._sequence), payload)
+
+            if self._sequence != first_sequence:
+                info_log(f"Chat events published: {self._sequence - first_sequence}")
+                self._condition.notify_all()
+
+    def hide(self, message_id):
+        """Record that a message was hidden by the user.
+
+        Args:
+            message_id (str): ID of the hidden message.
+        """
+        with self._condition:
+            if self._snapshot is None:
+                return
+            messages = self._snapshot.payload.get('messages', [])
+            for i, msg in enumerate(messages):
+                if (msg.get('id') == message_id) and msg.get('show'):
+                    self._append('hidden', {'id': message_id})
+                    # Copy-on-write: only the list and the hidden message are copied
+                    messages = messages[:i] + [dict(msg, show=False)] + messages[i + 1:]
+                    self._snapshot = ChatSnapshot(self._event_id(self._sequence), dict(self._snapshot.payload, messages=messages))
+                    self._condition.notify_all()
+                    break
+
+    def get_events(self, last_event_id, timeout=None):
+        """Return the events following the given one, waiting for new events up to timeout seconds.
+
+        Args:
+            last_event_id (str): ID of the last event received by the client (None for a new client).
+            timeout (float): Seconds to wait when there are no new events (None = do not wait).
+
+        Returns:
+            list: (event_id, event_type, data) tuples, empty if nothing happened before the timeout.
+                  When the client cannot be resumed a single 'snapshot' event is returned.
+        """
+        with self._condition:
+            sequence = self._parse_event_id(last_event_id) if last_event_id else None
+            if timeout and ((self._snapshot is None) or (sequence == self._sequence)):
+                self._condition.wait(timeout)
+
+            oldest_sequence = self._events[0][0] if self._events else self._sequence + 1
+            if (sequence is None) or (sequence > self._sequence) or (sequence < oldest_sequence - 1):
+                if self._snapshot is None:
+                    # Nothing to show yet: only errors may have been published
+                    return [(self._event_id(s), event_type, data) for s, event_type, data in self._events]
+                return [(self._event_id(self._sequence), 'snapshot', self._snapshot.payload)]
+
+            return [(self._event_id(s), event_type, data) for s, event_type, data in self._events if s > sequence]
+
+    def get_snapshot(self):
+        """Return the last published snapshot.
+
+        Returns:
+            ChatSnapshot: The snapshot, None if nothing has been published yet.
+        """
+        with self._condition:
+            return self._snapshot
+
+    def get_cursor(self):
+        """Return the ID of the last event."""
+        with self._condition:
+            return self._event_id(self._sequence)
+
+    @staticmethod
+    def format_event(event_id, event_type, data):
+        """Format an event for a text/event-stream response."""
+        return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    @staticmethod
+    def _live_title(payload):
+        for msg in (payload or {}).get('messages', []):
+            if msg.get('live_title'):
+                return msg.get('live_title')
+        return None
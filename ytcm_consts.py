@@ -10,6 +10,16 @@ YTCM_OPENAI_BASE_URL = None
 YTCM_GPT_MODEL = "gpt-4.1-nano" # GPT model to use
 
 YTCM_POLLY_CONFIG_FILE =os.path.abspath(os.path.join(os.path.dirname(__file__), 'config', 'ytcm_polly_credentials.json'))
+YTCM_HTTP_MAX_CONNECTIONS = 20  # Maximum number of pooled connections to each AI/TTS API (OpenAI, AWS Polly)
+YTCM_HTTP_KEEPALIVE_S = 60  # Seconds an idle pooled connection is kept open
+YTCM_HTTP_CONNECT_TIMEOUT_S = 5  # Connection timeout in seconds for the AI/TTS API requests
+YTCM_HTTP_READ_TIMEOUT_S = 30  # Read timeout in seconds for the AI/TTS API requests
+
+# Persistence configuration
+YTCM_STORE_FLUSH_INTERVAL_S = 2  # Maximum seconds a change to the stored messages waits before being written to disk (0 = write at every change)
+YTCM_STORE_FLUSH_THRESHOLD = 100  # Number of pending changes to the stored messages written to disk immediately
+YTCM_STORE_FILE_CHECK_INTERVAL_S = 1  # Minimum seconds between two checks for changes made by other processes to the hidden IDs files
+YTCM_JOURNAL_COMPACT_RECORDS = 5000  # Number of records in a journal (data/*.jsonl) triggering its compaction into the JSON file
 
 # Logging configuration
 YTCM_DEBUG_MODE = True  # Enable/disable error logging
@@ -32,13 +42,38 @@ YTCM_RETRIEVE_MSG_AUTHOR_GENDER = True
 YTCM_APPLY_SPELLING_CORRECTION = True
 YTCM_MSG_FORCED_LANG = 'Italian'   # If YTCM_APPLY_SPELLING_CORRECTION = True, force messages language (None = no translation)
 YTCM_FORCE_MSG_UPPERCASE = True
+YTCM_AI_ANALYSIS_MODE = 'batch'  # How new messages are analyzed: 'separate' (one OpenAI request per message and per analysis), 'fused' (one request per message), 'batch' (one request per YTCM_AI_BATCH_SIZE messages)
+YTCM_AI_CONCURRENCY = 20  # Maximum number of new messages (or batches) analyzed at the same time
+YTCM_AI_CACHE_MAX_ENTRIES = 100000  # Maximum number of AI verdicts kept in the local cache (0 = cache disabled)
+YTCM_AI_BATCH_SIZE = 20  # Number of new messages analyzed with a single OpenAI request in 'batch' mode
 
 # Text-To-Speech configuration (available voices: https://docs.aws.amazon.com/polly/latest/dg/available-voices.html)
 YTCM_MALE_TTS_VOICE = 'Giorgio'
 YTCM_FEMALE_TTS_VOICE = 'Bianca'
 YTCM_TTS_AUDIO_FILES_DIR = 'static/tmp/ytcm/'  # Directory to store TTS audio files
+YTCM_TTS_CACHE_MAX_BYTES = 200 * 1024 * 1024  # Maximum total size in bytes of the cached TTS audio files (least recently used ones are deleted first)
+YTCM_TTS_CACHE_MAX_ENTRIES = 5000  # Maximum number of cached TTS audio files
+YTCM_TTS_STREAM_CHUNK_BYTES = 16384  # Size of the audio chunks streamed to the browser (and written to the cache) while Polly synthesizes
+YTCM_TTS_PART_MAX_CHARS = 1000  # Long texts are split (at sentence boundaries) into parts of at most this many characters, synthesized in parallel (Polly limit: 3000)
+YTCM_TTS_PART_CONCURRENCY = 4  # Maximum number of parts of a long text synthesized at the same time
+YTCM_TTS_RETRY_AFTER_S = 2  # Seconds a client is asked to wait (Retry-After) when the audio it requests is still being synthesized for another request
+YTCM_TTS_STATUS_MAX_IDS = 500  # Maximum number of messages in a single audio status request
+YTCM_TTS_PREFETCH = 'questions'  # Audio generated in the background for the new messages: 'off', 'questions' (only questions) or 'all'
+YTCM_TTS_PREFETCH_WORKERS = 4  # Number of threads generating audio in the background
+YTCM_TTS_PREFETCH_QUEUE_SIZE = 50  # Maximum number of new messages waiting for background audio generation (newest first, oldest dropped)
 
 # Polling configuration
 YTCM_POLLING_INTERVAL_MS = 10000  # Polling interval in milliseconds for fetching messages
+YTCM_POLLING_MAX_INTERVAL_MS = 60000  # Maximum delay in milliseconds between two background chat reads (quiet chat or quota running out)
+YTCM_POLLING_TARGET_MESSAGES = 10  # New chat messages per read the adaptive polling aims at (busy chats are read more often)
+YTCM_YT_DAILY_QUOTA = 10000  # YouTube Data API quota units per day of the Google Cloud project
+YTCM_YT_QUOTA_HORIZON_H = 8  # Hours the quota left must last (at most until the daily reset, midnight Pacific Time)
+YTCM_YT_QUOTA_COSTS = {'liveChatMessages.list': 5, 'liveBroadcasts.list': 1, 'liveStreams.list': 1, 'channels.list': 1}  # Estimated quota units per YouTube Data API call
+YTCM_INGESTION_MIN_INTERVAL_MS = 2000  # Minimum delay in milliseconds between two background chat reads (YouTube pollingIntervalMillis is honoured when longer)
+YTCM_INGESTION_WAIT_TIMEOUT_S = 20  # Maximum seconds a request arriving before the first ingestion result waits for it
+YTCM_STREAM_EVENT_HISTORY = 1000  # Number of chat events kept to resume the stream clients that reconnect
+YTCM_STREAM_KEEPALIVE_S = 15  # Seconds between two keepalive comments on an idle message stream
+YTCM_STREAM_RETRY_MS = 3000  # Milliseconds the browser waits before reconnecting a dropped message stream
+YTCM_YT_METADATA_CACHE_TTL_S = 30  # Seconds live chat ID, live title and channel name are cached before asking YouTube again
 
 YTCM_LAYOUT_STYLE = 'dark'  # Avaiable layout style: standard, dark, high-contrast
\ No newline at end of file
@@ -0,0 +1,136 @@
+import threading
+from ytcm_consts import *
+from ytcm_utils import *
+
+class ChatIngestionWorker:
+    """Runs the chat ingestion cycle in a background thread and keeps its last result in memory.
+
+    The cycle callable does the actual work (YouTube read, AI processing, persistence) and
+    returns the payload to send to the clients, together with the delay before the next cycle.
+    HTTP requests only read the published snapshot, so they never wait for the ingestion; those
+    arriving before the first result can wait for the cycle in flight (wait_for_cycle), which runs
+    once whatever the number of waiting requests. Every stop() starts a new generation: a cycle
+    started before it checks is_current_cycle() and its result is never published.
+    """
+
+    def __init__(self, cycle):
+        """Initialize the worker.
+
+        Args:
+            cycle (callable): Function without arguments returning (payload, next_delay_ms).
+        """
+        self._cycle = cycle
+        self._thread = None
+        self._lock = threading.Lock()
+        # Notified (with _lock held) at the end of every cycle
+        self._cycle_done = threading.Condition(self._lock)
+        self._completed_cycles = 0
+        self._in_flight = False
+        self._generation = 0
+        self._cycle_generation = 0
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._snapshot = None
+        info_log("Initialized ChatIngestionWorker")
+
+    def start(self):
+        """Start the background thread if it is not already running.
+
+        A thread still finishing a cycle after stop() goes on running the cycles of the new generation.
+
+        Returns:
+            bool: True if a new thread was started, False if the worker was already running.
+        """
+        with self._lock:
+            self._stop_event.clear()
+            if self._thread:
+                return False
+            self._thread = threading.Thread(target=self._run, name='ytcm-ingestion', daemon=True)
+            self._thread.start()
+        info_log("Chat ingestion worker started")
+        return True
+
+    def stop(self):
+        """Ask the background thread to stop after the current cycle and forget the last snapshot."""
+        with self._lock:
+            self._generation += 1
+            self._stop_event.set()
+            self._wake_event.set()
+            self._snapshot = None
+        info_log("Chat ingestion worker stop requested")
+
+    def wake(self):
+        """Run the next cycle immediately instead of waiting for the polling interval."""
+        self._wake_event.set()
+
+    def is_running(self):
+        """Check if the background thread is running.
+
+        Returns:
+            bool: True if the worker is running and not stopping.
+        """
+        with self._lock:
+            return (self._thread is not None) and (not self._stop_event.is_set())
+
+    def is_current_cycle(self):
+        """Check if the cycle in progress was started after the last stop() (to be called from the cycle).
+
+        Returns:
+            bool: False if the results of the cycle are stale and must be dropped.
+        """
+        with self._lock:
+            return self._cycle_generation == self._generation
+
+    def get_snapshot(self):
+        """Return the payload published by the last completed cycle.
+
+        Returns:
+            dict: Last published payload, None if no cycle has completed yet.
+        """
+        return self._snapshot
+
+    def wait_for_cycle(self, timeout):
+        """Wait for the end of the cycle in flight (or of the next one, started immediately).
+
+        Args:
+            timeout (float): Maximum seconds to wait.
+
+        Returns:
+            dict: Last published payload, None if no cycle has completed yet.
+        """
+        with self._cycle_done:
+            if self._thread is None:
+                return self._snapshot
+            target = self._completed_cycles + 1
+            if not self._in_flight:
+                self._wake_event.set()
+            self._cycle_done.wait_for(lambda: (self._completed_cycles >= target) or (self._thread is None), timeout)
+            return self._snapshot
+
+    def _run(self):
+        """Thread body: run cycles until stopped, waiting the requested delay between them."""
+        while True:
+            with self._lock:
+                if self._stop_event.is_set():
+                    self._thread = None
+                    self._cycle_done.notify_all()
+                    info_log("Chat ingestion worker stopped")
+                    return
+                self._wake_event.clear()
+                self._in_flight = True
+                self._cycle_generation = self._generation
+
+            try:
+                payload, next_delay_ms = self._cycle()
+            except Exception as e:
+                err_log(f"Error during chat ingestion cycle: {str(e)}")
+                payload, next_delay_ms = None, YTCM_POLLING_INTERVAL_MS
+
+            with self._lock:
+                if (payload is not None) and (not self._stop_event.is_set()) and (self._cycle_generation == self._generation):
+                    self._snapshot = payload
+                self._in_flight = False
+                self._completed_cycles += 1
+                self._cycle_done.notify_all()
+
+            self._wake_event.wait(max(next_delay_ms, YTCM_INGESTION_MIN_INTERVAL_MS) * 0.001)
@@ -0,0 +1,116 @@
+import os
+import json
+import threading
+from ytcm_consts import *
+from ytcm_utils import *
+
+class JournalFile:
+    """Append-only persistence of a store: a JSON snapshot plus a JSONL journal of the later changes.
+
+    Each change is appended to the journal as one JSON record per line, so saving a change costs
+    the size of the change and not the size of the store. When the journal grows beyond
+    YTCM_JOURNAL_COMPACT_RECORDS records it is compacted: the whole store is written to a new
+    snapshot, atomically renamed over the old one, and the journal is emptied. At startup the
+    snapshot is loaded and the journal replayed; a last record truncated by a crash is ignored.
+    """
+
+    def __init__(self, snapshot_path, journal_path=None, compact_records=YTCM_JOURNAL_COMPACT_RECORDS):
+        """Initialize the journal.
+
+        Args:
+            snapshot_path (str): Path of the JSON snapshot file.
+            journal_path (str): Path of the JSONL journal file (default: snapshot path with the .jsonl extension).
+            compact_records (int): Number of journal records triggering a compaction.
+        """
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or (os.path.splitext(snapshot_path)[0] + '.jsonl')
+        self.compact_records = compact_records
+        self.records = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read the snapshot and the journal records written after it.
+
+        Returns:
+            tuple: (snapshot, records), snapshot is None if there is no snapshot file.
+        """
+        with self._lock:
+            snapshot = None
+            if os.path.exists(self.snapshot_path):
+                with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+
+            records = []
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                for line_number, line in enumerate(content.splitlines(), 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        err_log(f"Ignoring corrupted record at line {line_number} of {self.journal_path}")
+                if content and (not content.endswith('\n')):
+                    # Terminate a record truncated by a crash, so the next record starts on its own line
+                    with open(self.journal_path, 'a', encoding='utf-8') as f:
+                        f.write('\n')
+            self.records = len(records)
+            return snapshot, records
+
+    def append(self, records):
+        """Append change records to the journal.
+
+        Args:
+            records (list): JSON serializable records.
+
+        Returns:
+            bool: True if the journal should now be compacted.
+        """
+        if not records:
+            return self.needs_compaction()
+        data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        with self._lock:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(data)
+            self.records += len(records)
+            return self.records >= self.compact_records
+
+    def signature(self):
+        """Return the modification time and size of the snapshot and journal files.
+
+        Returns:
+            tuple: Changes whenever one of the files is written (by this or another process).
+        """
+        signature = []
+        for path in (self.snapshot_path, self.journal_path):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def needs_compaction(self):
+        """Check if the journal has grown beyond the compaction threshold."""
+        with self._lock:
+            return self.records >= self.compact_records
+
+    def write_snapshot(self, data, indent=2):
+        """Replace the snapshot with the given data and empty the journal.
+
+        Args:
+            data: JSON serializable content of the whole store.
+            indent (int): Indentation of the snapshot file.
+        """
+        with self._lock:
+            temp_path = self.snapshot_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=indent)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path)
+            # Only now the journal records are in the snapshot
+            with open(self.journal_path, 'w', encoding='utf-8'):
+                pass
+            self.records = 0
@@ -1,10 +1,19 @@
 import os
-import json
 import datetime
+import threading
+import time
 from ytcm_utils import *
+from ytcm_write_behind import WriteBehind
+from ytcm_journal import JournalFile
 
 class ytcm_ChatMessagesManager:
-    """Class for managing chat messages, saving them in a JSON file."""
+    """Class for managing chat messages, saving them in a JSON file.
+
+    Messages are kept in memory, indexed by ID and by (author, publication time): the file
+    is read only at startup. Changes are
+    written behind (see WriteBehind) as records appended to a journal next to the file, which
+    is compacted into the file from time to time (see JournalFile).
+    """
     
     def __init__(self, file_path=os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), 'data')), 'ycm-chat_messages.json')):
         """Initialize the chat messages manager.
@@ -16,7 +25,14 @@ class ytcm_ChatMessagesManager:
         info_log(f"Initializing ytcm_ChatMessagesManager with file: {file_path}")
 
         self.messages = []
+        self.messages_by_id = {}
+        self.messages_by_author_time = {}
         self.file_path = file_path
+        self._lock = threading.RLock()
+        self._journal = JournalFile(file_path)
+        # Change records not yet appended to the journal
+        self._pending_records = []
+        self._writer = WriteBehind('chat messages', self._save_messages)
         self._ensure_directory_exists()
         self._load_messages()
     
@@ -30,48 +46,112 @@ class ytcm_ChatMessagesManager:
             info_log(f"Directory already exists: {directory}")
     
     def _load_messages(self):
-        """Load messages from the JSON file if it exists."""
+        """Load messages from the JSON file and replay the journal, if they exist."""
 
         try:
-            if os.path.exists(self.file_path):
-                with open(self.file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    # Convert dictionaries to objects compatible with ytcm_ChatMessageCustom
-                    self.messages = []
-                    for msg_dict in data:
-                        # Recreate the object with the same attributes
-                        msg = type('ytcm_ChatMessageCustom', (), {})()
-                        for key, value in msg_dict.items():
-#                            if key == 'datetime':
-                                # Convert the datetime string to a datetime object
-#                                value = datetime.datetime.fromisoformat(value)
-                            setattr(msg, key, value)
-                        self.messages.append(msg)            
-            info_log(f"Loaded {len(self.messages)} messages from file {self.file_path}")
+            data, records = self._journal.load()
+            # Convert dictionaries to objects compatible with ytcm_ChatMessageCustom
+            self.messages = [self._message_from_dict(msg_dict) for msg_dict in (data or [])]
+            self._rebuild_indexes()
+            for record in records:
+                self._apply_record(record)
+            info_log(f"Loaded {len(self.messages)} messages from file {self.file_path} ({len(records)} journal records replayed)")
         except Exception as e:
             err_log(f"Error loading messages: {str(e)}")
             self.messages = []
+            self._rebuild_indexes()
+    
+    @staticmethod
+    def _message_from_dict(msg_dict):
+        """Recreate a message object with the attributes of a saved message."""
+        msg = type('ytcm_ChatMessageCustom', (), {})()
+        for key, value in msg_dict.items():
+            setattr(msg, key, value)
+        return msg
+    
+    def _apply_record(self, record):
+        """Apply a journal record to the in-memory messages."""
+        op = record.get('op')
+        if op == 'add':
+            msg = self._message_from_dict(record['msg'])
+            if msg.id not in self.messages_by_id:
+                self.messages.append(msg)
+                self._index_message(msg)
+        elif op == 'show':
+            msg = self.messages_by_id.get(record['id'])
+            if msg is not None:
+                msg.show = record['show']
+        elif op == 'remove':
+            msg = self.messages_by_id.get(record['id'])
+            if msg is not None:
+                self.messages.remove(msg)
+                self._unindex_message(msg)
+        elif op == 'clear':
+            self.messages = []
+            self._rebuild_indexes()
+    
+    def _rebuild_indexes(self):
+        """Rebuild the message indexes from the message list."""
+        self.messages_by_id = {}
+        self.messages_by_author_time = {}
+        for msg in self.messages:
+            self._index_message(msg)
+    
+    def _index_message(self, msg):
+        """Add a message to the indexes (the first message of an author at a given time wins)."""
+        self.messages_by_id[msg.id] = msg
+        self.messages_by_author_time.setdefault((msg.author, msg.datetime), msg)
+    
+    def _unindex_message(self, msg):
+        """Remove a message from the indexes."""
+        self.messages_by_id.pop(msg.id, None)
+        key = (msg.author, msg.datetime)
+        if self.messages_by_author_time.get(key) is msg:
+            del self.messages_by_author_time[key]
+            # Another message of the same author at the same time takes its place
+            for other in self.messages:
+                if (other.author, other.datetime) == key:
+                    self.messages_by_author_time[key] = other
+                    break
+    
+    def _record(self, record):
+        """Record a change to save (call with the lock held)."""
+        self._pending_records.append(record)
+        self._writer.mark_dirty()
     
     def _save_messages(self):
-        """Save messages to the JSON file."""
+        """Append the pending changes to the journal, compacting it into the JSON file when it is too long."""
 
+        records = []
         try:
-            # Convert objects to serializable dictionaries
-            serializable_messages = []
-            for msg in self.messages:
-                msg_dict = {}
-                for key, value in msg.__dict__.items():
-#                    if key == 'datetime':
-                        # Convert the datetime object to a string
-#                        value = value.isoformat()
-                    msg_dict[key] = value
-                serializable_messages.append(msg_dict)
+            with self._lock:
+                records = self._pending_records
+                self._pending_records = []
+                compact = self._journal.needs_compaction() or (len(records) + self._journal.records >= self._journal.compact_records)
+                # Convert objects to serializable dictionaries (the snapshot already includes the pending changes)
+                serializable_messages = [dict(msg.__dict__) for msg in self.messages] if compact else None
             
-            with open(self.file_path, 'w', encoding='utf-8') as f:
-                json.dump(serializable_messages, f, ensure_ascii=False, indent=2)
-            info_log(f"Saved {len(serializable_messages)} messages to file {self.file_path}")
+            if compact:
+                self._journal.write_snapshot(serializable_messages)
+                info_log(f"Saved {len(serializable_messages)} messages to file {self.file_path}")
+            else:
+                self._journal.append(records)
+                info_log(f"Saved {len(records)} message changes to journal {self._journal.journal_path}")
         except Exception as e:
             err_log(f"Error saving messages: {str(e)}")
+            self._retry_records(records)
+    
+    def _retry_records(self, records):
+        """Put back the records of a failed save in front of the pending ones, to be saved again."""
+        if not records:
+            return
+        with self._lock:
+            self._pending_records = records + self._pending_records
+        self._writer.mark_dirty(len(records))
+    
+    def flush(self):
+        """Save the pending changes to the JSON file now."""
+        self._writer.flush()
     
     def add_message(self, message):
         """Add a message to the list and save.
@@ -79,15 +159,16 @@ class ytcm_ChatMessagesManager:
         Args:
             message: Message object to add.
         """
-        self._load_messages()
-        eq_ids = [m for m in self.messages if m.id == message.id]
-        if (not eq_ids) or (len(eq_ids) == 0):
-            self.messages.append(message)
-            self._save_messages()
-            info_log(f"Message added to list: {message} ({message.id}, {message.show})")
-        else:
-            info_log(f"Message already exists, not added: {message.id}")
-            self.update_message_visibility(message.id, message.show)
+        with self._lock:
+            existing = self.messages_by_id.get(message.id)
+            if existing is None:
+                self.messages.append(message)
+                self._index_message(message)
+                self._record({'op': 'add', 'msg': dict(message.__dict__)})
+                info_log(f"Message added to list: {message} ({message.id}, {message.show})")
+                return
+        info_log(f"Message already exists, not added: {message.id}")
+        self.update_message_visibility(message.id, message.show)
     
     def remove_message(self, message_id):
         """Remove a message from the list and save.
@@ -98,11 +179,12 @@ class ytcm_ChatMessagesManager:
         Returns:
             bool: True if the message was removed, False otherwise.
         """
-        self._load_messages()
-        for i, msg in enumerate(self.messages):
-            if msg.id == message_id:
-                del self.messages[i]
-                self._save_messages()
+        with self._lock:
+            msg = self.messages_by_id.get(message_id)
+            if msg is not None:
+                self.messages.remove(msg)
+                self._unindex_message(msg)
+                self._record({'op': 'remove', 'id': message_id})
                 info_log(f"Message removed with ID: {message_id}")
                 return True
         err_log(f"Attempt to remove message not found with ID: {message_id}")
@@ -114,14 +196,42 @@ class ytcm_ChatMessagesManager:
         Returns:
             list: List of all messages.
         """
-        self._load_messages()
-        return self.messages
+        with self._lock:
+            return list(self.messages)
+    
+    def get_message(self, message_id):
+        """Return a message by ID.
+        
+        Args:
+            message_id (str): ID of the message.
+        
+        Returns:
+            The message, None if not found.
+        """
+        with self._lock:
+            return self.messages_by_id.get(message_id)
+    
+    def find_message_by_author_time(self, author, published_at):
+        """Return the message of an author published at a given time.
+        
+        Args:
+            author (str): Author of the message.
+            published_at (str): Publication time of the message.
+        
+        Returns:
+            The first such message, None if not found.
+        """
+        with self._lock:
+            return self.messages_by_author_time.get((author, published_at))
     
     def clear_messages(self):
         """Delete all messages and save."""
-        count = len(self.messages)
-        self.messages = []
-        self._save_messages()
+        with self._lock:
+            count = len(self.messages)
+            self.messages = []
+            self._rebuild_indexes()
+            self._record({'op': 'clear'})
+        self._writer.flush()
         info_log(f"Deleted {count} messages from the list")
     
     def find_message(self, message):
@@ -133,11 +243,9 @@ class ytcm_ChatMessagesManager:
         Returns:
             bool: True if the message was found, False otherwise.
         """
-        self._load_messages()
-        for msg in self.messages:
-            if str(msg) == str(message):
-                return True
-        return False
+        # Messages are equal when they have the same author and raw text, which is what the ID hashes
+        with self._lock:
+            return message.id in self.messages_by_id
     
     def update_message_visibility(self, message_id, show_value):
         """Update the visibility of a message.
@@ -151,20 +259,25 @@ class ytcm_ChatMessagesManager:
         """
         if show_value:
             return True
-        self._load_messages()
 
-        for i in range(len(self.messages)):
-            if self.messages[i].id == message_id:
-                self.messages[i].show = show_value
-                self._save_messages()
-                info_log(f"Updated message visibility for {self.messages[i]} ({message_id}) to {self.messages[i].show}")
+        with self._lock:
+            msg = self.messages_by_id.get(message_id)
+            if msg is not None:
+                msg.show = show_value
+                self._record({'op': 'show', 'id': message_id, 'show': show_value})
+                info_log(f"Updated message visibility for {msg} ({message_id}) to {msg.show}")
                 return True
 
         info_log(f"Attempt to update visibility for message not found: {message_id}")
         return False
 
 class ytcm_HiddenMessagesManager:
-    """Class for managing hidden message IDs, saving them in a JSON file."""
+    """Class for managing hidden message IDs, saving them in a JSON file.
+
+    The IDs are kept in memory: the files are read again only when their modification time or
+    size changes (e.g. written by another process), checked at most every
+    YTCM_STORE_FILE_CHECK_INTERVAL_S seconds. Changes are written behind, like the messages.
+    """
     
     def __init__(self, file_path=os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), 'data')), 'ycm-hidden_messages.json'), messages:ytcm_ChatMessagesManager = None):
         """Initialize the hidden message IDs manager.
@@ -175,6 +288,15 @@ class ytcm_HiddenMessagesManager:
         self.hidden_msg_ids = set()
         self.file_path = file_path
         self.messages = messages
+        self._lock = threading.RLock()
+        self._journal = JournalFile(file_path)
+        # Change records not yet appended to the journal
+        self._pending_records = []
+        self._writer = WriteBehind('hidden IDs', self._save_hidden_ids)
+        self._file_signature = None
+        self._file_checked_at = 0
+        # True while the writer is writing the files, whose signature is not known yet
+        self._saving = False
         self._ensure_directory_exists()
         self._load_hidden_ids()
         info_log(f"Initialized ytcm_HiddenMessagesManager with file: {file_path}")
@@ -189,26 +311,87 @@ class ytcm_HiddenMessagesManager:
             info_log(f"Directory already exists: {directory}")
     
     def _load_hidden_ids(self):
-        """Load hidden message IDs from the JSON file if it exists."""
+        """Load hidden message IDs from the JSON file and replay the journal, if they exist."""
 
-        try:
-            if os.path.exists(self.file_path):
-                with open(self.file_path, 'r', encoding='utf-8') as f:
-                    self.hidden_msg_ids = set(json.load(f))
-                info_log(f"Loaded {len(self.hidden_msg_ids)} hidden IDs from file {self.file_path}")
-        except Exception as e:
-            err_log(f"Error loading hidden IDs: {str(e)}")
+        with self._lock:
+            try:
+                self._file_signature = self._journal.signature()
+                data, records = self._journal.load()
+                self.hidden_msg_ids = set(data or [])
+                # Changes not saved yet are applied over the saved ones
+                for record in records + self._pending_records:
+                    self._apply_record(record)
+                info_log(f"Loaded {len(self.hidden_msg_ids)} hidden IDs from file {self.file_path} ({len(records)} journal records replayed)")
+            except Exception as e:
+                err_log(f"Error loading hidden IDs: {str(e)}")
+                self.hidden_msg_ids = set()
+    
+    def _apply_record(self, record):
+        """Apply a journal record to the in-memory IDs."""
+        if record.get('op') == 'add':
+            self.hidden_msg_ids.add(record['id'])
+        elif record.get('op') == 'remove':
+            self.hidden_msg_ids.discard(record['id'])
+        elif record.get('op') == 'clear':
             self.hidden_msg_ids = set()
     
+    def _refresh(self):
+        """Reload the IDs if the files were changed by someone else since the last check."""
+        now = time.monotonic()
+        if self._saving or (now - self._file_checked_at < YTCM_STORE_FILE_CHECK_INTERVAL_S):
+            # Files half written by our own save are not read back (checked again after the save)
+            return
+        self._file_checked_at = now
+        if self._journal.signature() != self._file_signature:
+            info_log(f"Hidden IDs files changed on disk, reloading: {self.file_path}")
+            self._load_hidden_ids()
+    
+    def _record(self, record):
+        """Record a change to save (call with the lock held)."""
+        self._apply_record(record)
+        self._pending_records.append(record)
+        self._writer.mark_dirty()
+    
     def _save_hidden_ids(self):
-        """Save hidden message IDs to the JSON file."""
+        """Append the pending changes to the journal, or save all the IDs to the JSON file after a clear or when the journal is too long."""
 
+        records = []
         try:
-            with open(self.file_path, 'w', encoding='utf-8') as f:
-                json.dump(list(self.hidden_msg_ids), f, ensure_ascii=False, indent=2)
-            info_log(f"Saved {len(self.hidden_msg_ids)} hidden IDs to file {self.file_path}")
+            with self._lock:
+                records = self._pending_records
+                self._pending_records = []
+                compact = any(record.get('op') == 'clear' for record in records) or (len(records) + self._journal.records >= self._journal.compact_records)
+                # The snapshot is taken under the lock, the files are written outside it
+                hidden_ids = list(self.hidden_msg_ids) if compact else None
+                self._saving = True
+            
+            if compact:
+                self._journal.write_snapshot(hidden_ids)
+                info_log(f"Saved {len(hidden_ids)} hidden IDs to file {self.file_path}")
+            else:
+                self._journal.append(records)
+                info_log(f"Saved {len(records)} hidden IDs changes to journal {self._journal.journal_path}")
+            with self._lock:
+                # Own writes must not trigger a reload
+                self._file_signature = self._journal.signature()
         except Exception as e:
             err_log(f"Error saving hidden IDs: {str(e)}")
+            self._retry_records(records)
+        finally:
+            with self._lock:
+                self._saving = False
+    
+    def _retry_records(self, records):
+        """Put back the records of a failed save in front of the pending ones, to be saved again."""
+        if not records:
+            return
+        with self._lock:
+            self._pending_records = records + self._pending_records
+        self._writer.mark_dirty(len(records))
+    
+    def flush(self):
+        """Save the pending changes now."""
+        self._writer.flush()
     
     def add_hidden_id(self, message_id):
         """Add an ID to the list of hidden IDs and save.
@@ -216,12 +399,13 @@ class ytcm_HiddenMessagesManager:
         Args:
             message_id (str): ID of the message to hide.
         """
-        self._load_hidden_ids()
-        self.hidden_msg_ids.add(message_id)
+        with self._lock:
+            self._refresh()
+            self._record({'op': 'add', 'id': message_id})
         if self.messages:
             self.messages.update_message_visibility(message_id, False)
-            info_log(f"[ytcm_HiddenMessagesManager.add_hidden_id] Show setted to False for message with ID {message_id}: \"{next((m for m in self.messages.get_messages() if m.id == message_id)).raw_text if next((m for m in self.messages.get_messages() if m.id == message_id), None) else '[MESSAGE ID NOT FOUND]'}\"")
-        self._save_hidden_ids()
+            hidden_msg = self.messages.get_message(message_id)
+            info_log(f"[ytcm_HiddenMessagesManager.add_hidden_id] Show setted to False for message with ID {message_id}: \"{hidden_msg.raw_text if hidden_msg else '[MESSAGE ID NOT FOUND]'}\"")
         info_log(f"Added ID {message_id} to the hidden IDs list")
     
     def remove_hidden_id(self, message_id):
@@ -234,12 +418,12 @@ class ytcm_HiddenMessagesManager:
             bool: True if the ID was removed, False otherwise.
         """
         return True
-        self._load_hidden_ids()
-        if message_id in self.hidden_msg_ids:
-            self.hidden_msg_ids.remove(message_id)
-            self._save_hidden_ids()
-            info_log(f"Removed ID {message_id} from the hidden IDs list")
-            return True
+        with self._lock:
+            self._refresh()
+            if message_id in self.hidden_msg_ids:
+                self._record({'op': 'remove', 'id': message_id})
+                info_log(f"Removed ID {message_id} from the hidden IDs list")
+                return True
         info_log(f"Attempt to remove ID not found: {message_id}")
         return False
     
@@ -252,8 +436,9 @@ class ytcm_HiddenMessagesManager:
         Returns:
             bool: True if the ID is hidden, False otherwise.
         """
-        self._load_hidden_ids()
-        return message_id in self.hidden_msg_ids
+        with self._lock:
+            self._refresh()
+            return message_id in self.hidden_msg_ids
     
     def get_hidden_ids(self):
         """Return all hidden IDs.
@@ -261,17 +446,19 @@ class ytcm_HiddenMessagesManager:
         Returns:
             set: Set of all hidden IDs.
         """
-        self._load_hidden_ids()
-        return self.hidden_msg_ids
+        with self._lock:
+            self._refresh()
+            return set(self.hidden_msg_ids)
     
     def clear_hidden_ids(self, force=False):
         """Delete all hidden IDs and save."""
-        self._load_hidden_ids()
-        count = len(self.hidden_msg_ids)
-        if force or (count > 1000):
-            self.hidden_msg_ids = set()
-            self._save_hidden_ids()
-            info_log(f"Deleted {count} hidden IDs")
-        else:
-            info_log(f"No deletion of hidden IDs (count={count}, force={force})")
-            self._load_hidden_ids()
+        with self._lock:
+            self._refresh()
+            count = len(self.hidden_msg_ids)
+            if force or (count > 1000):
+                self._record({'op': 'clear'})
+            else:
+                info_log(f"No deletion of hidden IDs (count={count}, force={force})")
+                return
+        self._writer.flush()
+        info_log(f"Deleted {count} hidden IDs")
@@ -1,17 +1,34 @@
 import openai
+import httpx
 import re
+import json
+import asyncio
 from ytcm_consts import *
 from ytcm_utils import *
+from ytcm_ai_cache import AIVerdictCache, ytcm_ai_cache
+from ytcm_async_runner import ytcm_async_runner
 
 class OpenAIService:
     def __init__(self, api_key):
         self.api_key = api_key
-        openai.api_key = api_key
-        openai.base_url = YTCM_OPENAI_BASE_URL
         self.model = YTCM_GPT_MODEL
+        self.moderation_model = "omni-moderation-latest"
+        # Long-lived client: connections are pooled and kept alive between the requests
+        timeout = httpx.Timeout(YTCM_HTTP_READ_TIMEOUT_S, connect=YTCM_HTTP_CONNECT_TIMEOUT_S)
+        limits = httpx.Limits(max_connections=YTCM_HTTP_MAX_CONNECTIONS, max_keepalive_connections=YTCM_HTTP_MAX_CONNECTIONS, keepalive_expiry=YTCM_HTTP_KEEPALIVE_S)
+        # Used on the shared event loop by the awaitable methods, the other methods wait for them
+        self.async_client = openai.AsyncOpenAI(api_key=api_key, base_url=YTCM_OPENAI_BASE_URL, timeout=timeout, http_client=httpx.AsyncClient(timeout=timeout, limits=limits))
+    
+    def close(self):
+        """Closes the pooled connections of the client (the service must not be used afterwards)"""
+        try:
+            # The client belongs to the shared event loop
+            ytcm_async_runner.run(self.async_client.close(), timeout=YTCM_HTTP_CONNECT_TIMEOUT_S)
+            info_log("OpenAI service client closed")
+        except Exception as e:
+            err_log(f"Error closing OpenAI service client: {str(e)}")
     
     def is_question(self, text):
-
         """
         Determines if the text is a question using OpenAI GPT-4o
         
@@ -21,7 +38,15 @@ class OpenAIService:
         Returns:
             bool: True if the text is a question, False otherwise
         """
+        return ytcm_async_runner.run(self.is_question_async(text))
+
+    async def is_question_async(self, text):
+        """Awaitable version of is_question()"""
         try:
+            cached = ytcm_ai_cache.get(self._verdict_key('is_question', {'text': text}))
+            if cached is not None:
+                return cached
+
             # Prepare the prompt for the API
             prompt = f"""Determine if the following message is a question. Answer only with 'YES' or 'NO'.
             
@@ -29,7 +54,7 @@ class OpenAIService:
             """
             
             # Call to OpenAI API
-            response = openai.chat.completions.create (
+            response = await self.async_client.chat.completions.create (
                 model=self.model,
                 messages=[
                     {
@@ -65,6 +90,7 @@ class OpenAIService:
             
             info_log(f"OpenAI has determined that the message '{text}' is a question: {answer == 'YES'}")
             
+            ytcm_ai_cache.set(self._verdict_key('is_question', {'text': text}), answer == 'YES')
             return answer == 'YES'
         
         except Exception as e:
@@ -73,16 +99,25 @@ class OpenAIService:
             return False
 
     def is_appropriate(self, text):
+        return ytcm_async_runner.run(self.is_appropriate_async(text))
+
+    async def is_appropriate_async(self, text):
+        """Awaitable version of is_appropriate()"""
         try:
-            response = openai.moderations.create(
+            cached = ytcm_ai_cache.get(self._verdict_key('is_appropriate', {'text': text}))
+            if cached is not None:
+                return cached
+
+            response = await self.async_client.moderations.create(
                 input=text,
-                model="omni-moderation-latest"
+                model=self.moderation_model
             )
             results = response.results[0]
             is_inappropriate = results.flagged
 
             info_log(f"OpenAI has determined that the message '{text}' is appropriate: {not is_inappropriate}")
 
+            ytcm_ai_cache.set(self._verdict_key('is_appropriate', {'text': text}), not is_inappropriate)
             return not is_inappropriate
         except Exception as e:
             err_log(f"Error during message moderation with OpenAI: {str(e)}")
@@ -98,7 +133,15 @@ class OpenAIService:
         Returns:
             bool: True if the username likely belongs to a male user, False otherwise
         """
+        return ytcm_async_runner.run(self.is_male_username_async(username))
+
+    async def is_male_username_async(self, username):
+        """Awaitable version of is_male_username()"""
         try:
+            cached = ytcm_ai_cache.get(self._verdict_key('is_male', {'author': username}))
+            if cached is not None:
+                return cached
+
             # Prepare the prompt for the API
             prompt = f"""Analyze the following YouTube username and determine if it likely belongs to a male user. 
             Consider common male names, masculine words, and typical male identifiers.
@@ -108,7 +151,7 @@ class OpenAIService:
             """
             
             # Call to OpenAI API
-            response = openai.chat.completions.create (
+            response = await self.async_client.chat.completions.create (
                 model=self.model,
                 messages=[
                     {
@@ -144,13 +187,14 @@ class OpenAIService:
             
             info_log(f"OpenAI has determined that the username '{username}' belongs to a male user: {answer == 'YES'}")
             
+            ytcm_ai_cache.set(self._verdict_key('is_male', {'author': username}), answer == 'YES')
             return answer == 'YES'
         
         except Exception as e:
             err_log(f"Error during username gender analysis with OpenAI: {str(e)}")
             # In case of error, we return False
             return False
-            
+
     def correct_text(self, text):
         """
         Corrects spelling and improves the form of a text while preserving YouTube emoticons
@@ -161,29 +205,23 @@ class OpenAIService:
         Returns:
             str: The corrected text with preserved emoticons
         """
+        return ytcm_async_runner.run(self.correct_text_async(text))
+
+    async def correct_text_async(self, text):
+        """Awaitable version of correct_text()"""
         try:
             if not text:
                 return text
+
+            cached = ytcm_ai_cache.get(self._verdict_key('text', {'text': text}))
+            if cached is not None:
+                return cached
                 
-            # Identify YouTube emoticons using regex pattern
-            emoticon_pattern = r':([-a-z]+):'
-            emoticons = re.findall(emoticon_pattern, text)
-            
             # Replace emoticons with placeholders to protect them
-            protected_text = text
-            placeholder_map = {}
-            
-            for i, emoticon in enumerate(emoticons):
-                emoticon_code = f':{emoticon}:'
-                placeholder = f'__EMOTICON_{i}__'
-                protected_text = protected_text.replace(emoticon_code, placeholder)
-                placeholder_map[placeholder] = emoticon_code
+            protected_text, placeholder_map = self._protect_emoticons(text)
             
             # Prepare the prompt for the API
-            if YTCM_MSG_FORCED_LANG:
-                translation_addendum = f" \nIf the text language is different from {YTCM_MSG_FORCED_LANG}, translate the text into {YTCM_MSG_FORCED_LANG}."
-            else:
-                translation_addendum = ""
+            translation_addendum = self._translation_addendum()
             prompt = f"""Correct the spelling and improve the form of the following text. 
             Maintain the original meaning and tone. Do not add or remove information.
             If the text contains placeholders in the format __EMOTICON_X__, then do not modify any of these placeholders.
@@ -194,7 +232,7 @@ class OpenAIService:
             """
             
             # Call to OpenAI API
-            response = openai.chat.completions.create (
+            response = await self.async_client.chat.completions.create (
                 model=self.model,
                 messages=[
                     {
@@ -229,14 +267,281 @@ class OpenAIService:
             corrected_text = response.choices[0].message.content.strip()
             
             # Restore emoticons from placeholders
-            for placeholder, emoticon_code in placeholder_map.items():
-                corrected_text = corrected_text.replace(placeholder, emoticon_code)
+            corrected_text = self._restore_emoticons(corrected_text, placeholder_map)
             
             info_log(f"OpenAI has corrected the text: '{text}' to '{corrected_text}'")
             
+            ytcm_ai_cache.set(self._verdict_key('text', {'text': text}), corrected_text)
             return corrected_text
         
         except Exception as e:
             err_log(f"Error during text correction with OpenAI: {str(e)}")
             # In case of error, return the original text
             return text
+
+    def _protect_emoticons(self, text):
+        """
+        Replaces YouTube emoticons with placeholders the model is asked not to modify
+        
+        Args:
+            text (str): The text to protect
+            
+        Returns:
+            tuple: (protected text, {placeholder: emoticon code})
+        """
+        # Identify YouTube emoticons using regex pattern
+        emoticon_pattern = r':([-a-z]+):'
+        emoticons = re.findall(emoticon_pattern, text)
+        
+        protected_text = text
+        placeholder_map = {}
+        
+        for i, emoticon in enumerate(emoticons):
+            emoticon_code = f':{emoticon}:'
+            placeholder = f'__EMOTICON_{i}__'
+            protected_text = protected_text.replace(emoticon_code, placeholder)
+            placeholder_map[placeholder] = emoticon_code
+
+        return protected_text, placeholder_map
+
+    def _restore_emoticons(self, text, placeholder_map):
+        """Puts back the emoticons replaced by _protect_emoticons()"""
+        for placeholder, emoticon_code in placeholder_map.items():
+            text = text.replace(placeholder, emoticon_code)
+        return text
+
+    def _translation_addendum(self):
+        """Returns the prompt addendum asking to translate into YTCM_MSG_FORCED_LANG (empty if not set)"""
+        if YTCM_MSG_FORCED_LANG:
+            return f" \nIf the text language is different from {YTCM_MSG_FORCED_LANG}, translate the text into {YTCM_MSG_FORCED_LANG}."
+        return ""
+
+    async def are_appropriate_async(self, texts):
+        """
+        Moderates several texts with a single OpenAI moderation request
+        
+        Args:
+            texts (list): The texts to moderate
+            
+        Returns:
+            list: One bool per text, True if the text is appropriate
+        """
+        verdicts = [ytcm_ai_cache.get(self._verdict_key('is_appropriate', {'text': text})) for text in texts]
+        to_moderate = [i for i, verdict in enumerate(verdicts) if verdict is None]
+        if not to_moderate:
+            return verdicts
+        try:
+            response = await self.async_client.moderations.create(
+                input=[texts[i] for i in to_moderate],
+                model=self.moderation_model
+            )
+            if len(response.results) != len(to_moderate):
+                raise ValueError(f"{len(response.results)} moderation results for {len(to_moderate)} texts")
+            for i, result in zip(to_moderate, response.results):
+                verdicts[i] = not result.flagged
+                ytcm_ai_cache.set(self._verdict_key('is_appropriate', {'text': texts[i]}), verdicts[i])
+
+            info_log(f"OpenAI has moderated {len(to_moderate)} messages: {[verdicts[i] for i in to_moderate].count(False)} not appropriate")
+
+            return verdicts
+        except Exception as e:
+            err_log(f"Error during batch moderation with OpenAI, moderating one message at a time: {str(e)}")
+            return list(await asyncio.gather(*(self.is_appropriate_async(text) for text in texts)))
+
+    def classify_batch(self, messages, questions=True, moderation=True, gender=True, correction=True):
+        """
+        Analyzes several chat messages with one chat completion (and one concurrent moderation request)
+        
+        Args:
+            messages (list): The messages to analyze (dicts with 'text' and 'author')
+            questions (bool): Determine if each message is a question
+            moderation (bool): Determine if each message is appropriate
+            gender (bool): Determine if each author username likely belongs to a male user
+            correction (bool): Correct (and translate if YTCM_MSG_FORCED_LANG is set) each text
+            
+        Returns:
+            list: One dict per message with 'is_question', 'is_appropriate', 'is_male' and 'text'
+                  (None for the analyses not requested). Items missing or malformed in the model
+                  output are analyzed again with the single message methods.
+        """
+        return ytcm_async_runner.run(self.classify_batch_async(messages, questions, moderation, gender, correction))
+
+    async def classify_batch_async(self, messages, questions=True, moderation=True, gender=True, correction=True):
+        """Awaitable version of classify_batch(), the chat completion and the moderation request run concurrently"""
+        if not messages:
+            return []
+
+        if moderation:
+            results, verdicts = await asyncio.gather(self._complete_analyses(messages, questions, gender, correction), self.are_appropriate_async([msg['text'] for msg in messages]))
+            for result, verdict in zip(results, verdicts):
+                result['is_appropriate'] = verdict
+        else:
+            results = await self._complete_analyses(messages, questions, gender, correction)
+
+        return results
+
+    def analyze(self, text, author, questions=True, moderation=True, gender=True, correction=True):
+        """
+        Analyzes a chat message with one chat completion, moderating it concurrently
+        
+        Args:
+            text (str): The message text
+            author (str): The YouTube username of the author
+            questions (bool): Determine if the message is a question
+            moderation (bool): Determine if the message is appropriate
+            gender (bool): Determine if the username likely belongs to a male user
+            correction (bool): Correct (and translate if YTCM_MSG_FORCED_LANG is set) the text
+            
+        Returns:
+            dict: 'is_question', 'is_appropriate', 'is_male' and 'text' (None for the analyses not requested)
+        """
+        return ytcm_async_runner.run(self.analyze_async(text, author, questions, moderation, gender, correction))
+
+    async def analyze_async(self, text, author, questions=True, moderation=True, gender=True, correction=True):
+        """Awaitable version of analyze(), the chat completion and the moderation request run concurrently"""
+        if moderation:
+            results, verdict = await asyncio.gather(self._complete_analyses([{'text': text, 'author': author}], questions, gender, correction), self.is_appropriate_async(text))
+            results[0]['is_appropriate'] = verdict
+        else:
+            results = await self._complete_analyses([{'text': text, 'author': author}], questions, gender, correction)
+
+        return results[0]
+
+    async def _complete_analyses(self, messages, questions, gender, correction):
+        """
+        Asks the question, gender and correction verdicts of the messages in one structured chat completion
+        
+        Args:
+            messages (list): The messages to analyze (dicts with 'text' and 'author')
+            questions (bool): Determine if each message is a question
+            gender (bool): Determine if each author username likely belongs to a male user
+            correction (bool): Correct (and translate if YTCM_MSG_FORCED_LANG is set) each text
+            
+        Returns:
+            list: One dict per message with 'is_question', 'is_appropriate' (always None), 'is_male' and 'text'
+        """
+        results = [{'is_question': None, 'is_appropriate': None, 'is_male': None, 'text': None} for msg in messages]
+
+        fields = {}
+        if questions:
+            fields['is_question'] = '- "is_question": true if the message is a question, false otherwise.'
+        if gender:
+            fields['is_male'] = '- "is_male": true if the author username likely belongs to a male user (consider common male names, masculine words, and typical male identifiers), false otherwise.'
+        if correction:
+            fields['text'] = f'- "text": the message text with corrected spelling and improved form. Maintain the original meaning and tone. Do not add or remove information. Do not modify the placeholders in the format __EMOTICON_X__, emoticons, symbols or special characters.{self._translation_addendum()}'
+        if not fields:
+            return results
+
+        # Verdicts already known are not requested again
+        to_request = []
+        for i, (msg, result) in enumerate(zip(messages, results)):
+            for field in fields:
+                result[field] = ytcm_ai_cache.get(self._verdict_key(field, msg))
+            if any(result[field] is None for field in fields):
+                to_request.append(i)
+        if not to_request:
+            return results
+
+        protected = {i: self._protect_emoticons(messages[i]['text']) for i in to_request}
+        answers = {}
+        try:
+            # Prepare the prompt for the API
+            chat_messages = [{'index': i, 'author': messages[i]['author'], 'text': protected[i][0]} for i in to_request]
+            fields_description = '\n'.join(fields.values())
+            prompt = f"""Analyze each of the following YouTube chat messages, identified by their index.
+            For each message provide:
+            {fields_description}
+            Reply only with a JSON object in the format {{"results": [{{"index": 0, ...}}, ...]}} containing one result for every message.
+            
+            Messages: {json.dumps(chat_messages, ensure_ascii=False)}
+            """
+            
+            # Call to OpenAI API
+            response = await self.async_client.chat.completions.create (
+                model=self.model,
+                messages=[
+                    {
+                    "role": "system",
+                    "content": [
+                        {
+                        "type": "text",
+                        "text": "You are an assistant that analyzes YouTube live chat messages. Reply only with a JSON object."
+                        }
+                    ]
+                    },
+                    {
+                    "role": "user",
+                    "content": [
+                        {
+                        "type": "text",
+                        "text": prompt
+                        }
+                    ]
+                    }
+                ],
+                response_format={
+                    "type": "json_object"
+                },
+                temperature=0.3,
+                top_p=1,
+                frequency_penalty=0,
+                presence_penalty=0
+            )
+
+            # Map the answers back to the messages by index
+            for answer in json.loads(response.choices[0].message.content).get('results', []):
+                if isinstance(answer, dict) and isinstance(answer.get('index'), int):
+                    answers[answer['index']] = answer
+        
+        except Exception as e:
+            err_log(f"Error during message analysis with OpenAI: {str(e)}")
+
+        # Missing or malformed answers are requested again one message at a time, all together
+        fallbacks = []
+        for i in to_request:
+            msg, result, answer = messages[i], results[i], answers.get(i, {})
+            if questions and (result['is_question'] is None):
+                if isinstance(answer.get('is_question'), bool):
+                    result['is_question'] = answer['is_question']
+                    ytcm_ai_cache.set(self._verdict_key('is_question', msg), result['is_question'])
+                else:
+                    fallbacks.append((result, 'is_question', self.is_question_async(msg['text'])))
+            if gender and (result['is_male'] is None):
+                if isinstance(answer.get('is_male'), bool):
+                    result['is_male'] = answer['is_male']
+                    ytcm_ai_cache.set(self._verdict_key('is_male', msg), result['is_male'])
+                else:
+                    fallbacks.append((result, 'is_male', self.is_male_username_async(msg['author'])))
+            if correction and (result['text'] is None):
+                if isinstance(answer.get('text'), str) and answer['text'].strip():
+                    result['text'] = self._restore_emoticons(answer['text'].strip(), protected[i][1])
+                    ytcm_ai_cache.set(self._verdict_key('text', msg), result['text'])
+                else:
+                    fallbacks.append((result, 'text', self.correct_text_async(msg['text'])))
+        if fallbacks:
+            verdicts = await asyncio.gather(*(request for result, field, request in fallbacks))
+            for (result, field, request), verdict in zip(fallbacks, verdicts):
+                result[field] = verdict
+
+        info_log(f"OpenAI has analyzed {len(to_request)} of {len(messages)} messages in one request ({len(fallbacks)} analyses repeated one message at a time, cache: {ytcm_ai_cache.get_stats()})")
+
+        return results
+
+    def _verdict_key(self, field, msg):
+        """
+        Builds the verdict cache key of an analysis
+        
+        Args:
+            field (str): The analysis ('is_question', 'is_appropriate', 'is_male' or 'text')
+            msg (dict): The analyzed message ('text' and/or 'author')
+            
+        Returns:
+            str: The cache key
+        """
+        if field == 'is_male':
+            return AIVerdictCache.author_key(msg['author'], self.model)
+        if field == 'is_appropriate':
+            return AIVerdictCache.text_key('moderation', msg['text'], self.moderation_model)
+        if field == 'text':
+            return AIVerdictCache.text_key('correction', msg['text'], self.model, YTCM_MSG_FORCED_LANG)
+        return AIVerdictCache.text_key('question', msg['text'], self.model)
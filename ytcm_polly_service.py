@@ -1,10 +1,22 @@
 import boto3
 import os
+import re
 import json
+import threading
+import collections
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 from ytcm_consts import *
 from ytcm_utils import *
+from ytcm_audio_cache import ytcm_audio_cache
 
 class PollyService:
+    # Polly clients shared by all the instances, by credentials: a service created again reuses the pooled connections
+    _clients = {}
+    _clients_lock = threading.Lock()
+    # Parts of the long texts synthesized in parallel
+    _parts_executor = ThreadPoolExecutor(max_workers=YTCM_HTTP_MAX_CONNECTIONS, thread_name_prefix='ytcm-polly-part')
+
     def __init__(self, credentials_file):
         self.polly_client = None
         self.initialized = False
@@ -16,12 +28,7 @@ class PollyService:
                     credentials = json.load(f)
                 
                 # Initialize Polly client
-                self.polly_client = boto3.client(
-                    'polly',
-                    aws_access_key_id=credentials['aws_access_key_id'],
-                    aws_secret_access_key=credentials['aws_secret_access_key'],
-                    region_name=credentials['region_name']
-                )
+                self.polly_client = self._get_client(credentials)
                 self.initialized = True
                 info_log("AWS Polly service initialized successfully")
             else:
@@ -29,78 +36,291 @@ class PollyService:
         except Exception as e:
             err_log(f"Error initializing AWS Polly service: {str(e)}")
     
+    @classmethod
+    def _get_client(cls, credentials):
+        """Returns the shared Polly client for the credentials, creating it if needed"""
+        key = (credentials['aws_access_key_id'], credentials['aws_secret_access_key'], credentials['region_name'])
+        with cls._clients_lock:
+            if key not in cls._clients:
+                cls._clients[key] = boto3.client(
+                    'polly',
+                    aws_access_key_id=credentials['aws_access_key_id'],
+                    aws_secret_access_key=credentials['aws_secret_access_key'],
+                    region_name=credentials['region_name'],
+                    config=Config(
+                        max_pool_connections=YTCM_HTTP_MAX_CONNECTIONS,
+                        connect_timeout=YTCM_HTTP_CONNECT_TIMEOUT_S,
+                        read_timeout=YTCM_HTTP_READ_TIMEOUT_S,
+                        tcp_keepalive=True,
+                        retries={'max_attempts': 3, 'mode': 'standard'}
+                    )
+                )
+            return cls._clients[key]
+
     def is_available(self):
         """Checks if the Polly service is available"""
         return self.initialized and self.polly_client is not None
     
     def _clean_emoji_codes(self, text):
         """Removes YouTube emoji codes from the text"""
-        import re
         # Removes all codes in the format :emoji-name: or :name:
         cleaned_text = re.sub(r':[a-zA-Z0-9-]+:', '', text)
         return cleaned_text
     
+    def _prepare_text(self, text, message_id, is_male):
+        """Returns the text to synthesize, the voice and the audio cache key (None if there is nothing to synthesize)"""
+        # Cleans the text by removing emoji codes
+        cleaned_text = self._clean_emoji_codes(text)
+        info_log(f"Generating audio for message ID: {message_id}, text length: {len(cleaned_text)}")
+        
+        # Determines the voice to use based on gender
+        voice_id = self._get_voice_id(is_male)
+        if not voice_id:
+            err_log("No voice configured for TTS")
+            return None
+            
+        # Check that the text is not empty
+        if not cleaned_text.strip():
+            err_log(f"Empty text for message ID: {message_id}")
+            return None
+            
+        return cleaned_text, voice_id, ytcm_audio_cache.make_key(cleaned_text, voice_id, 'mp3', '24000')
+
+    def _split_text(self, text):
+        """Splits a text into parts of at most YTCM_TTS_PART_MAX_CHARS characters, at sentence boundaries when possible"""
+        max_chars = min(YTCM_TTS_PART_MAX_CHARS, 3000)  # Polly has a 3000 character limit per request
+        text = text.strip()
+        if len(text) <= max_chars:
+            return [text]
+
+        # Sentences, and the pieces of the sentences too long for a single part
+        pieces = []
+        for sentence in re.split(r'(?<=[.!?;…])\s+|\n+', text):
+            sentence = sentence.strip()
+            while len(sentence) > max_chars:
+                # Cut at the last clause or word boundary before the limit
+                cut = max(sentence.rfind(', ', 0, max_chars), sentence.rfind(' ', 0, max_chars))
+                cut = cut + 1 if cut > 0 else max_chars
+                pieces.append(sentence[:cut].strip())
+                sentence = sentence[cut:].strip()
+            if sentence:
+                pieces.append(sentence)
+
+        # Sentences packed into parts
+        parts = []
+        for piece in pieces:
+            if parts and (len(parts[-1]) + 1 + len(piece) <= max_chars):
+                parts[-1] += ' ' + piece
+            else:
+                parts.append(piece)
+        return parts
+
+    def _synthesize_part(self, text, voice_id):
+        """Calls Polly for a text of at most 3000 characters and returns the AudioStream"""
+        response = self.polly_client.synthesize_speech(
+            Text=text,
+            OutputFormat='mp3',
+            VoiceId=voice_id,
+            SampleRate='24000'
+        )
+        
+        # Check that the response contains the AudioStream
+        if 'AudioStream' not in response:
+            raise ValueError("No AudioStream in Polly response")
+        return response['AudioStream']
+
+    def _read_part(self, text, voice_id):
+        """Synthesizes a part of a long text and returns its audio data"""
+        audio_stream = self._synthesize_part(text, voice_id)
+        try:
+            return audio_stream.read()
+        finally:
+            audio_stream.close()
+
+    def _read_stream(self, audio_stream):
+        """Yields the chunks of a Polly AudioStream"""
+        try:
+            yield from audio_stream.iter_chunks(YTCM_TTS_STREAM_CHUNK_BYTES)
+        finally:
+            audio_stream.close()
+
+    def _read_parts(self, parts, voice_id, first_stream):
+        """Yields the audio of the parts of a long text in order, the next parts being synthesized in parallel"""
+        pending = collections.deque()
+        next_parts = iter(parts[1:])
+
+        def submit_next():
+            part = next(next_parts, None)
+            if part is not None:
+                pending.append(self._parts_executor.submit(self._read_part, part, voice_id))
+
+        # At most YTCM_TTS_PART_CONCURRENCY requests at the same time, the streamed first part included
+        for _ in range(max(YTCM_TTS_PART_CONCURRENCY - 1, 1)):
+            submit_next()
+        try:
+            # MP3 frames are independent: the audio of consecutive parts is concatenated as it is
+            yield from self._read_stream(first_stream)
+            while pending:
+                audio_data = pending.popleft().result()
+                submit_next()
+                for offset in range(0, len(audio_data), YTCM_TTS_STREAM_CHUNK_BYTES):
+                    yield audio_data[offset:offset + YTCM_TTS_STREAM_CHUNK_BYTES]
+        finally:
+            first_stream.close()
+            for future in pending:
+                future.cancel()
+
+    def _get_cached_or_start(self, cache_key, message_id):
+        """Returns the cached audio file, or None when the caller has to synthesize it (and end the synthesis)
+
+        A synthesis of the same audio in progress for another request is waited for instead of being repeated.
+
+        Raises:
+            TimeoutError: The synthesis in progress did not end within YTCM_HTTP_READ_TIMEOUT_S.
+        """
+        while True:
+            file_path = ytcm_audio_cache.get(cache_key)
+            if file_path:
+                ytcm_audio_cache.link_message(message_id, cache_key)
+                info_log(f"Audio found in cache for message ID: {message_id}")
+                return file_path
+            if ytcm_audio_cache.start_synthesis(cache_key):
+                return None
+            # Cached meanwhile, or synthesized for another request: checked again once done
+            if not ytcm_audio_cache.wait_synthesis(cache_key, YTCM_HTTP_READ_TIMEOUT_S):
+                raise TimeoutError(f"Audio still being synthesized for message ID: {message_id}")
+
+    def _synthesize(self, cleaned_text, voice_id, cache_key, message_id):
+        """Calls Polly and returns an iterator over the audio chunks, saved in the audio cache as they are read
+
+        The synthesis of cache_key, started with _get_cached_or_start(), is ended when the iterator is
+        exhausted or closed, or here if Polly fails.
+        """
+        try:
+            # Long texts are read in full, split into parts synthesized in parallel
+            parts = self._split_text(cleaned_text)
+            info_log(f"Calling Polly API with voice: {voice_id} ({len(parts)} parts)")
+
+            # The first part is streamed as Polly sends it
+            try:
+                first_stream = self._synthesize_part(parts[0], voice_id)
+            except ValueError:
+                err_log(f"No AudioStream in Polly response for message ID: {message_id}")
+                ytcm_audio_cache.end_synthesis(cache_key)
+                return None
+
+            if len(parts) == 1:
+                chunks = self._read_stream(first_stream)
+            else:
+                chunks = self._read_parts(parts, voice_id, first_stream)
+            tee = self._tee_to_cache(chunks, cache_key, message_id)
+            # Runs up to the first chunk: from there closing the iterator, even unread, ends the synthesis
+            next(tee)
+            return tee
+        except BaseException:
+            ytcm_audio_cache.end_synthesis(cache_key)
+            raise
+
+    def _tee_to_cache(self, chunks, cache_key, message_id):
+        """Yields the audio chunks (after an empty one) while writing them to the audio cache, then ends the synthesis"""
+        temp_path = ytcm_audio_cache.temp_path(cache_key)
+        size = 0
+        cached = False
+        try:
+            with open(temp_path, 'wb') as f:
+                try:
+                    yield b''
+                    for chunk in chunks:
+                        f.write(chunk)
+                        size += len(chunk)
+                        yield chunk
+                except GeneratorExit:
+                    # The client is gone: the rest of the audio is still saved for the next requests
+                    try:
+                        for chunk in chunks:
+                            f.write(chunk)
+                            size += len(chunk)
+                    except Exception as e:
+                        err_log(f"Error reading Polly audio for message ID: {message_id}, error: {str(e)}")
+                        return
+
+            if not size:
+                err_log(f"Empty audio data from Polly for message ID: {message_id}")
+                return
+
+            # Saves the audio file in the cache
+            file_path = ytcm_audio_cache.add_file(cache_key, temp_path)
+            ytcm_audio_cache.link_message(message_id, cache_key)
+            cached = True
+            info_log(f"Audio file generated successfully: {file_path}")
+        finally:
+            chunks.close()
+            if (not cached) and os.path.exists(temp_path):
+                os.remove(temp_path)
+            ytcm_audio_cache.end_synthesis(cache_key)
+
     def generate_audio(self, text, message_id, is_male=True):
         """Generates an MP3 audio file using AWS Polly"""
         if not self.is_available():
             err_log("AWS Polly service not available")
             return False
         try:
-            # Cleans the text by removing emoji codes
-            cleaned_text = self._clean_emoji_codes(text)
-            info_log(f"Generating audio for message ID: {message_id}, text length: {len(cleaned_text)}")
-            
-            # Determines the voice to use based on gender
-            voice_id = self._get_voice_id(is_male)
-            if not voice_id:
-                err_log("No voice configured for TTS")
-                return False
-                
-            # Check that the text is not empty
-            if not cleaned_text.strip():
-                err_log(f"Empty text for message ID: {message_id}")
+            prepared = self._prepare_text(text, message_id, is_male)
+            if not prepared:
                 return False
+            cleaned_text, voice_id, cache_key = prepared
                 
-            # Limit the text length if necessary (Polly has a 3000 character limit)
-            if len(cleaned_text) > 3000:
-                cleaned_text = cleaned_text[:3000]
-                info_log(f"Text truncated to 3000 characters for message ID: {message_id}")
-                
-            # Generates audio with Polly
-            info_log(f"Calling Polly API with voice: {voice_id}")
-            response = self.polly_client.synthesize_speech(
-                Text=cleaned_text,
-                OutputFormat='mp3',
-                VoiceId=voice_id,
-                SampleRate='24000'
-            )
-            
-            # Check that the response contains the AudioStream
-            if 'AudioStream' not in response:
-                err_log(f"No AudioStream in Polly response for message ID: {message_id}")
+            # The same text read by the same voice is synthesized only once
+            if self._get_cached_or_start(cache_key, message_id):
+                return True
+
+            # Generates audio with Polly, read in chunks so the memory used does not depend on the audio length
+            chunks = self._synthesize(cleaned_text, voice_id, cache_key, message_id)
+            if chunks is None:
                 return False
-                
-            # Creates the directory if it does not exist
-            audio_file_dir_full_path = os.path.abspath(os.path.join(os.path.dirname(__file__), YTCM_TTS_AUDIO_FILES_DIR))
-            os.makedirs(audio_file_dir_full_path, exist_ok=True)
-            
-            # Saves the audio file
-            file_path = os.path.join(audio_file_dir_full_path, f"{message_id}.mp3")
-            with open(file_path, 'wb') as f:
-                audio_data = response['AudioStream'].read()
-                if not audio_data:
-                    err_log(f"Empty audio data from Polly for message ID: {message_id}")
-                    return False
-                f.write(audio_data)
-                
-            info_log(f"Audio file generated successfully: {file_path}")
-            return True
+            size = 0
+            for chunk in chunks:
+                size += len(chunk)
+            return size > 0
         except Exception as e:
             err_log(f"Error generating audio file for message ID: {message_id}, error: {str(e)}")
             # Log more detailed error information for debugging
             import traceback
             err_log(f"Detailed error: {traceback.format_exc()}")
             return False
+
+    def stream_audio(self, text, message_id, is_male=True):
+        """Returns the audio of a message as soon as Polly starts sending it
+
+        Returns:
+            tuple: (file_path, None) if the audio is cached, (None, chunks) with an iterator over the
+                   audio being synthesized (and saved in the cache), (None, None) on failure.
+
+        Raises:
+            TimeoutError: The same audio is still being synthesized for another request.
+        """
+        if not self.is_available():
+            err_log("AWS Polly service not available")
+            return None, None
+        try:
+            prepared = self._prepare_text(text, message_id, is_male)
+            if not prepared:
+                return None, None
+            cleaned_text, voice_id, cache_key = prepared
+        except Exception as e:
+            err_log(f"Error streaming audio for message ID: {message_id}, error: {str(e)}")
+            return None, None
+
+        # A concurrent request for the same audio waits for its synthesis, then reads the cache entry
+        file_path = self._get_cached_or_start(cache_key, message_id)
+        if file_path:
+            return file_path, None
+
+        try:
+            return None, self._synthesize(cleaned_text, voice_id, cache_key, message_id)
+        except Exception as e:
+            err_log(f"Error streaming audio for message ID: {message_id}, error: {str(e)}")
+            return None, None
     
     def _get_voice_id(self, is_male):
         """Determines the voice ID to use based on gender"""
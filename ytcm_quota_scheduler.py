@@ -0,0 +1,160 @@
+import time
+import datetime
+import threading
+from ytcm_consts import *
+from ytcm_utils import *
+from data_bag import ytcm_data
+
+try:
+    from zoneinfo import ZoneInfo
+    _QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+except Exception:
+    # No time zone database: Pacific Standard Time
+    _QUOTA_TIMEZONE = datetime.timezone(datetime.timedelta(hours=-8))
+
+class QuotaScheduler:
+    """Tracks the YouTube Data API quota and chooses the interval between two chat reads
+
+    Every API call is recorded with its estimated cost (YTCM_YT_QUOTA_COSTS) against the daily
+    budget (YTCM_YT_DAILY_QUOTA), which Google resets at midnight Pacific Time; the units used
+    today are saved in ytcm_data, so they survive restarts. The read interval spreads the
+    remaining units over the next YTCM_YT_QUOTA_HORIZON_H hours, shortened while the chat is busy
+    and stretched while it is quiet: a faster read now is paid back by the next intervals, which
+    are computed from what remains.
+    """
+
+    def __init__(self):
+        """Initializes the scheduler"""
+        self._lock = threading.Lock()
+        self._velocity = None  # Messages per second (exponential moving average), None until two reads are recorded
+        self._last_poll_time = None
+        self._server_interval_ms = 0
+        self._catching_up = False
+        self._exhausted_day = None
+
+    @staticmethod
+    def _quota_day():
+        """Returns the current quota day (the date in Pacific Time)"""
+        return datetime.datetime.now(_QUOTA_TIMEZONE).date().isoformat()
+
+    @staticmethod
+    def _seconds_until_reset():
+        """Returns the seconds left before the daily quota reset"""
+        now = datetime.datetime.now(_QUOTA_TIMEZONE)
+        midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time(), tzinfo=_QUOTA_TIMEZONE)
+        return max((midnight - now).total_seconds(), 1)
+
+    def _get_usage(self):
+        """Returns the usage saved for the current quota day, starting a new one after the reset (call with the lock held)"""
+        usage = ytcm_data.ytcm_yt_quota
+        day = self._quota_day()
+        if (not usage) or (usage.get('day') != day):
+            ytcm_data.ytcm_yt_quota = {'day': day, 'used': 0, 'per_method': {}}
+            usage = ytcm_data.ytcm_yt_quota
+            info_log(f"YouTube quota day started: {day}")
+        return usage
+
+    def record(self, method, calls=1):
+        """Records YouTube Data API calls
+
+        Args:
+            method (str): API method (e.g. 'liveChatMessages.list').
+            calls (int): Number of calls.
+        """
+        cost = YTCM_YT_QUOTA_COSTS.get(method, 1) * calls
+        with self._lock:
+            usage = self._get_usage()
+            usage['used'] = usage.get('used', 0) + cost
+            usage['per_method'][method] = usage['per_method'].get(method, 0) + cost
+
+    def record_exhausted(self):
+        """Records that YouTube rejected a call because the quota is exhausted"""
+        with self._lock:
+            usage = self._get_usage()
+            self._exhausted_day = usage['day']
+            err_log(f"YouTube quota exhausted for {usage['day']} ({usage.get('used', 0)} units recorded)")
+
+    def record_poll(self, new_items, server_interval_ms, catching_up=False):
+        """Records the result of a chat read
+
+        Args:
+            new_items (int): Number of chat items received.
+            server_interval_ms (int): pollingIntervalMillis returned by YouTube.
+            catching_up (bool): True if more pages are waiting to be read.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._last_poll_time is not None:
+                rate = new_items / max(now - self._last_poll_time, 0.001)
+                # The first rate is taken as is: averaging it with nothing would understate a busy chat
+                self._velocity = rate if self._velocity is None else 0.3 * rate + 0.7 * self._velocity
+            self._last_poll_time = now
+            self._server_interval_ms = server_interval_ms
+            self._catching_up = catching_up
+
+    def reset_velocity(self):
+        """Forgets the chat velocity (e.g. when the live chat changes)"""
+        with self._lock:
+            self._velocity = None
+            self._last_poll_time = None
+            self._catching_up = False
+
+    def _remaining(self, usage):
+        """Returns the units left today (call with the lock held)"""
+        if self._exhausted_day == usage['day']:
+            return 0
+        return max(YTCM_YT_DAILY_QUOTA - usage.get('used', 0), 0)
+
+    def next_interval_ms(self):
+        """Returns the delay before the next chat read
+
+        Returns:
+            int: Milliseconds, between the interval requested by YouTube and YTCM_POLLING_MAX_INTERVAL_MS.
+        """
+        with self._lock:
+            usage = self._get_usage()
+            remaining = self._remaining(usage)
+            min_interval_ms = max(self._server_interval_ms, YTCM_INGESTION_MIN_INTERVAL_MS)
+            if remaining <= 0:
+                return YTCM_POLLING_MAX_INTERVAL_MS
+            if self._catching_up:
+                # Pages are waiting: read them as soon as YouTube allows
+                return min_interval_ms
+
+            # Interval spreading the remaining units over the horizon
+            horizon_s = min(self._seconds_until_reset(), YTCM_YT_QUOTA_HORIZON_H * 3600)
+            budget_ms = YTCM_YT_QUOTA_COSTS.get('liveChatMessages.list', 1) * horizon_s * 1000 / remaining
+
+            # Busy chat: read before too many messages pile up, quiet chat: save units
+            if self._velocity is None:
+                # No rate yet (first reads of a chat): neither shortened nor stretched
+                factor = 1.0
+            else:
+                expected_messages = self._velocity * budget_ms / 1000
+                factor = min(max(YTCM_POLLING_TARGET_MESSAGES / max(expected_messages, 0.001), 0.5), 2.0)
+
+            return int(min(max(budget_ms * factor, min_interval_ms), YTCM_POLLING_MAX_INTERVAL_MS))
+
+    def get_status(self):
+        """Returns the quota usage and the polling state
+
+        Returns:
+            dict: 'day', 'used', 'remaining', 'daily_quota', 'per_method', 'reset_in_s',
+                  'velocity' (messages per second, None until known) and 'next_interval_ms'.
+        """
+        next_interval_ms = self.next_interval_ms()
+        with self._lock:
+            usage = self._get_usage()
+            return {
+                'day': usage['day'],
+                'used': usage.get('used', 0),
+                'remaining': self._remaining(usage),
+                'daily_quota': YTCM_YT_DAILY_QUOTA,
+                'per_method': dict(usage.get('per_method', {})),
+                'reset_in_s': int(self._seconds_until_reset()),
+                'velocity': round(self._velocity, 3) if self._velocity is not None else None,
+                'next_interval_ms': next_interval_ms
+            }
+
+# Create an instance of the scheduler for global use
+ytcm_quota_scheduler = QuotaScheduler()
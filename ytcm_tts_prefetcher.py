@@ -0,0 +1,155 @@
+import threading
+import collections
+from ytcm_consts import *
+from ytcm_utils import *
+from ytcm_audio_cache import ytcm_audio_cache
+
+class TTSPrefetcher:
+    """Synthesizes the audio of the new messages in the background, before a moderator asks for it.
+
+    New messages are queued as they are approved and a small pool of worker threads generates
+    their audio into the audio cache, so opening a message overlay finds it ready. The queue is
+    bounded (YTCM_TTS_PREFETCH_QUEUE_SIZE): the newest messages are generated first and the oldest
+    pending ones are dropped when it is full. Hidden messages are removed from the queue, the audio
+    of those already being generated is discarded when done, and a request for a message being
+    generated waits for that generation instead of starting another.
+    """
+
+    def __init__(self, generate, workers=YTCM_TTS_PREFETCH_WORKERS, max_queue=YTCM_TTS_PREFETCH_QUEUE_SIZE):
+        """Initialize the prefetcher, the worker threads are started at the first enqueued message.
+
+        Args:
+            generate (callable): Function (text, message_id, is_male) generating the audio, returns True on success.
+            workers (int): Number of worker threads.
+            max_queue (int): Maximum number of messages waiting to be generated.
+        """
+        self._generate = generate
+        self.workers = workers
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        # Notified (with _lock held) when a message is queued and when a generation ends
+        self._changed = threading.Condition(self._lock)
+        self._queue = collections.OrderedDict()  # message ID -> (text, is_male), oldest first
+        self._in_flight = set()
+        # Messages cancelled while being generated: their audio is discarded at the end
+        self._cancelled = set()
+        self._threads = []
+        self.generated = 0
+        self.dropped = 0
+        info_log("Initialized TTSPrefetcher")
+
+    def enqueue(self, message_id, text, is_male=True):
+        """Queue a message for audio generation.
+
+        Args:
+            message_id (str): ID of the message.
+            text (str): Text to read, as the client would send it.
+            is_male (bool): Voice selection.
+
+        Returns:
+            bool: True if the message was queued, False if its audio is already available or in progress.
+        """
+        if (self.workers <= 0) or (self.max_queue <= 0) or ytcm_audio_cache.get_message_key(message_id):
+            return False
+        with self._lock:
+            if (message_id in self._in_flight) or (message_id in self._queue):
+                return False
+            self._queue[message_id] = (text, is_male)
+            while len(self._queue) > self.max_queue:
+                # Full queue: the oldest message is the least likely to be opened
+                self._queue.popitem(last=False)
+                self.dropped += 1
+            self._start_workers()
+            self._changed.notify_all()
+        return True
+
+    def cancel(self, message_id):
+        """Remove a message from the queue (e.g. when it is hidden), or discard its audio if it is being generated.
+
+        Args:
+            message_id (str): ID of the message.
+
+        Returns:
+            bool: True if the message was waiting in the queue or being generated.
+        """
+        with self._lock:
+            if message_id in self._in_flight:
+                self._cancelled.add(message_id)
+                return True
+            return self._queue.pop(message_id, None) is not None
+
+    def clear(self):
+        """Empty the queue (generations in progress are completed).
+
+        Returns:
+            int: Number of messages removed.
+        """
+        with self._lock:
+            count = len(self._queue)
+            self._queue.clear()
+            return count
+
+    def wait(self, message_id, timeout):
+        """Wait for the generation in progress of a message, if any.
+
+        Args:
+            message_id (str): ID of the message.
+            timeout (float): Maximum seconds to wait.
+
+        Returns:
+            bool: True if the message was being generated and is now done.
+        """
+        with self._lock:
+            if message_id not in self._in_flight:
+                return False
+            return self._changed.wait_for(lambda: message_id not in self._in_flight, timeout)
+
+    def is_pending(self, message_id):
+        """Check if a message is waiting for or under background generation."""
+        with self._lock:
+            return (message_id in self._queue) or (message_id in self._in_flight)
+
+    def get_stats(self):
+        """Return the prefetcher counters.
+
+        Returns:
+            dict: 'queued', 'in_flight', 'generated' and 'dropped'.
+        """
+        with self._lock:
+            return {'queued': len(self._queue), 'in_flight': len(self._in_flight), 'generated': self.generated, 'dropped': self.dropped}
+
+    def _start_workers(self):
+        """Start the worker threads not running yet (call with the lock held)."""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, name=f"ytcm-tts-prefetch-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _run(self):
+        """Worker thread loop."""
+        while True:
+            with self._lock:
+                self._changed.wait_for(lambda: self._queue)
+                # Newest message first
+                message_id, (text, is_male) = self._queue.popitem(last=True)
+                self._in_flight.add(message_id)
+            success = False
+            try:
+                # The audio may have been generated on demand meanwhile
+                if not ytcm_audio_cache.get_message_key(message_id):
+                    success = self._generate(text, message_id, is_male)
+            except Exception as e:
+                err_log(f"Error pre-generating audio for message ID: {message_id}, error: {str(e)}")
+            finally:
+                with self._lock:
+                    cancelled = message_id in self._cancelled
+                    self._cancelled.discard(message_id)
+                if cancelled and success:
+                    # Hidden while being generated: the audio is not kept for it
+                    ytcm_audio_cache.discard_message(message_id)
+                    info_log(f"Pre-generated audio discarded for cancelled message ID: {message_id}")
+                with self._lock:
+                    self._in_flight.discard(message_id)
+                    if success and not cancelled:
+                        self.generated += 1
+                    self._changed.notify_all()
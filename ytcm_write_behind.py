@@ -0,0 +1,84 @@
+import atexit
+import threading
+from ytcm_consts import *
+from ytcm_utils import *
+
+class WriteBehind:
+    """Coalesces the changes of an in-memory store into deferred saves.
+
+    Every change marks the store dirty; the save callable runs in a timer thread
+    YTCM_STORE_FLUSH_INTERVAL_S seconds after the first pending change, or immediately when
+    YTCM_STORE_FLUSH_THRESHOLD changes are pending. Pending changes are also saved when the
+    process exits.
+    """
+
+    def __init__(self, name, save, interval_s=YTCM_STORE_FLUSH_INTERVAL_S, threshold=YTCM_STORE_FLUSH_THRESHOLD):
+        """Initialize the writer.
+
+        Args:
+            name (str): Name of the store, used in the logs.
+            save (callable): Function without arguments writing the store to disk.
+            interval_s (float): Maximum seconds a change waits before being saved (0 = save at every change).
+            threshold (int): Number of pending changes saved immediately.
+        """
+        self.name = name
+        self._save = save
+        self.interval_s = interval_s
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        # Serializes the saves, so an older state never overwrites a newer one
+        self._save_lock = threading.Lock()
+        self._pending = 0
+        self._timer = None
+        self._timer_immediate = False
+        atexit.register(self.flush)
+
+    def mark_dirty(self, count=1):
+        """Record changes to save.
+
+        Never saves in the calling thread: the callers may hold the lock of their store, which the
+        save callable takes too, so the save is always left to the timer thread.
+
+        Args:
+            count (int): Number of changes.
+        """
+        with self._lock:
+            self._pending += count
+            flush_now = (self.interval_s <= 0) or (self._pending >= self.threshold)
+            if (self._timer is not None) and flush_now and (not self._timer_immediate):
+                # Too many pending changes to wait for the timer: saved as soon as possible
+                self._timer.cancel()
+                self._timer = None
+            if self._timer is None:
+                self._timer = threading.Timer(0 if flush_now else self.interval_s, self.flush)
+                self._timer.name = f"ytcm-flush-{self.name}"
+                self._timer.daemon = True
+                self._timer_immediate = flush_now
+                self._timer.start()
+
+    def flush(self):
+        """Save the pending changes now, if any.
+
+        Returns:
+            int: Number of changes saved.
+        """
+        with self._save_lock:
+            with self._lock:
+                pending = self._pending
+                self._pending = 0
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not pending:
+                return 0
+            try:
+                self._save()
+                info_log(f"Flushed {pending} pending changes of {self.name}")
+            except Exception as e:
+                err_log(f"Error flushing {self.name}: {str(e)}")
+            return pending
+
+    def has_pending(self):
+        """Check if there are changes not saved yet."""
+        with self._lock:
+            return self._pending > 0
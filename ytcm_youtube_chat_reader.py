@@ -10,6 +10,7 @@ from flask import request
 import time
 from ytcm_consts import *
 from ytcm_utils import *
+from ytcm_quota_scheduler import ytcm_quota_scheduler
 
 # logger = logging.getLogger('chat_magnifier')
 
@@ -18,6 +19,12 @@ class YouTubeChatReader:
         self.scopes = ['https://www.googleapis.com/auth/youtube.readonly']
         self.youtube = None
         self.live_chat_id = None
+        self.next_page_tokens = {}  # liveChatId -> nextPageToken of the last page read
+        self.polling_interval_ms = 0
+        self._broadcast_info = None
+        self._broadcast_info_time = 0
+        self._channel_name = None
+        self._channel_name_time = 0
         self.connected = False
         self.token_file = YTCM_YT_TOKEN_FILE
         self.redirect_uri = request.url_root + 'ytcm_oauth2callback'
@@ -97,118 +104,199 @@ class YouTubeChatReader:
         flow = Flow.from_client_secrets_file(YTCM_GOOGLE_CONFIG_FILE, scopes=self.scopes, redirect_uri=self.redirect_uri)
         return flow
 
-    def get_live_chat_id(self):
-        """Gets the live chat ID from the authenticated channel"""
+    def _get_broadcast_info(self):
+        """Gets live chat ID and title of the active broadcast, cached for YTCM_YT_METADATA_CACHE_TTL_S seconds
+        
+        Returns:
+            dict: {'live_chat_id': ..., 'live_title': ...} (values are None when there is no live stream),
+                  False in case of error (errors are never cached)
+        """
+        if self._broadcast_info and ((time.monotonic() - self._broadcast_info_time) < YTCM_YT_METADATA_CACHE_TTL_S):
+            return self._broadcast_info
+
         try:
+            live_chat_id = None
+            live_title = None
 
-            if not self.connected:
-                err_log("Not connected to YouTube", None)
-                return None
-                
-            # Get the list of active live broadcasts
+            # Get the list of active live broadcasts (chat ID and title come from the same response)
             request = self.youtube.liveBroadcasts().list(
-                part="snippet,contentDetails",
+                part="snippet",
                 broadcastStatus="active",
                 maxResults=5
             )
+            ytcm_quota_scheduler.record('liveBroadcasts.list')
             response = request.execute()
             
-            # Search for the live chat ID
-            for item in response.get('items', []):
+            items = response.get('items', [])
+            for item in items:
                 if 'liveChatId' in item['snippet']:
-                    return item['snippet']['liveChatId']
+                    live_chat_id = item['snippet']['liveChatId']
+                    live_title = item['snippet']['title']
+                    break
+            if (not live_title) and items:
+                live_title = items[0]['snippet']['title']
             
             # If not found, try to search in livestreams
-            request = self.youtube.liveStreams().list(
-                part="snippet,cdn",
-                mine=True,
-                maxResults=5
-            )
-            response = request.execute()
-            
-            for item in response.get('items', []):
-                if 'activeLiveChatId' in item['snippet']:
-                    return item['snippet']['activeLiveChatId']
-            
-            return None
-        
+            if (not live_chat_id) or (not live_title):
+                request = self.youtube.liveStreams().list(
+                    part="snippet",
+                    mine=True,
+                    maxResults=5
+                )
+                ytcm_quota_scheduler.record('liveStreams.list')
+                response = request.execute()
+                
+                for item in response.get('items', []):
+                    if (not live_chat_id) and ('activeLiveChatId' in item['snippet']):
+                        live_chat_id = item['snippet']['activeLiveChatId']
+                    if (not live_title) and item['snippet'].get('isDefaultStream'):
+                        live_title = item['snippet']['title']
+
+            self._broadcast_info = {'live_chat_id': live_chat_id, 'live_title': live_title}
+            self._broadcast_info_time = time.monotonic()
+            info_log(f"Broadcast info cached: {self._broadcast_info}")
+            return self._broadcast_info
+
         except HttpError as e:
-            err_log(f"HTTP error while retrieving live chat ID: {str(e)}")
+            self._check_quota_error(e)
+            err_log(f"HTTP error while retrieving broadcast info: {str(e)}")
             return False
         except Exception as e:
-            err_log(f"Error while retrieving live chat ID: {str(e)}")
+            err_log(f"Error while retrieving broadcast info: {str(e)}")
             return False
+
+    @staticmethod
+    def _check_quota_error(error):
+        """Tells the quota scheduler when YouTube rejects a call because the daily quota is exhausted"""
+        if (getattr(error, 'resp', None) is not None) and (error.resp.status == 403) and ('quota' in str(error).lower()):
+            ytcm_quota_scheduler.record_exhausted()
+
+    def invalidate_cache(self):
+        """Forgets the cached broadcast info and channel name, so the next lookups call the APIs again"""
+        self._broadcast_info = None
+        self._broadcast_info_time = 0
+        self._channel_name = None
+        self._channel_name_time = 0
+        info_log("YouTube metadata cache invalidated")
+
+    def get_live_chat_id(self):
+        """Gets the live chat ID from the authenticated channel"""
+
+        if not self.connected:
+            err_log("Not connected to YouTube", None)
+            return None
+
+        broadcast_info = self._get_broadcast_info()
+        if not broadcast_info:
+            return False
+        return broadcast_info['live_chat_id']
     
     def get_new_messages(self):
-        """Gets new messages from the live chat"""
+        """Gets the messages published after the last page read from the live chat"""
 
         if not self.connected:
             err_log("Not connected to YouTube", None)
             return None
 
         # Get the live chat ID
-        self.live_chat_id = self.get_live_chat_id()            
+        live_chat_id = self.get_live_chat_id()
+        if live_chat_id is False:
+            # Transient API error: the chat and its cursor are kept for the next poll
+            err_log("Live chat ID not available, messages not read", None)
+            return False
+        if live_chat_id != self.live_chat_id:
+            # A different chat (or no chat at all): the old cursor and chat velocity are meaningless
+            self.reset_page_tokens()
+            ytcm_quota_scheduler.reset_velocity()
+        self.live_chat_id = live_chat_id
         if not self.live_chat_id:
             err_log("No live stream found on the channel", None)
             return self.live_chat_id
         
         try:
-            # Request chat messages
-            next_page_token = None
-            total_results = 0
-            processed_results = 0
-            polling_interval = 0
-            messages = []
-
-            while True:
-                # Request chat messages
-                time.sleep(polling_interval * 0.001)
-                request = self.youtube.liveChatMessages().list(
-                    liveChatId=self.live_chat_id,
-                    part="snippet,authorDetails",
-                    maxResults=2000,
-                    pageToken=next_page_token
-                )
-                response = request.execute()
-                polling_interval = int(response.get('pollingIntervalMillis', 0))
-                # Update token for the next request
-                next_page_token = response.get('nextPageToken')
-                info_log(f"Next page token updated: {next_page_token}")
-                # Update total results
-                total_results = response.get('pageInfo', {}).get('totalResults', 0)            
-                
-                # Extract messages
-                for item in response.get('items', []):
-                    
-                    info_log(f"[YouTubeChatReader.get_new_messages] Processing message received: {str({k: str(v) for k,v in item.items()})}")    
-
-                    if item['snippet']['type'] == 'textMessageEvent':
-                        messages.append({
-                            'author': item['authorDetails']['displayName'],
-                            'text': item['snippet']['displayMessage'],
-                            'published_at': item['snippet']['publishedAt']
-                        })
-                        processed_results += 1
-                
-                # Check if all results have been processed
-                if processed_results >= total_results:
-                    break
-
-            info_log(f"Retrieved {len(messages)} new messages")
-            
-            return messages
+            next_page_token = self.next_page_tokens.get(self.live_chat_id)
+            try:
+                return self._read_messages_from(next_page_token)
+            except HttpError as e:
+                if not next_page_token:
+                    raise
+                # The saved cursor may have expired: restart from the chat history
+                err_log(f"HTTP error reading from saved page token, resetting cursor: {str(e)}")
+                self.next_page_tokens.pop(self.live_chat_id, None)
+                return self._read_messages_from(None)
         
         except HttpError as e:
+            self._check_quota_error(e)
             err_log(f"HTTP error during message retrieval: {str(e)}")
             return False
         except Exception as e:
             err_log(f"Error during message retrieval: {str(e)}")
             return False
+
+    def _read_messages_from(self, next_page_token):
+        """Reads the chat page following the given cursor and saves the new cursor
+        
+        A full page means more messages are waiting: they are read by the next poll, which the
+        quota scheduler runs as soon as YouTube allows (pollingIntervalMillis), instead of
+        waiting here.
+        
+        Args:
+            next_page_token (str): Page token returned by the previous read (None = start of the chat)
+            
+        Returns:
+            list: Text messages published after the cursor
+        """
+        max_results = 2000
+        messages = []
+
+        # Request chat messages
+        request = self.youtube.liveChatMessages().list(
+            liveChatId=self.live_chat_id,
+            part="snippet,authorDetails",
+            maxResults=max_results,
+            pageToken=next_page_token
+        )
+        ytcm_quota_scheduler.record('liveChatMessages.list')
+        response = request.execute()
+        self.polling_interval_ms = int(response.get('pollingIntervalMillis', 0))
+        items = response.get('items', [])
+
+        # Update token for the next poll
+        if response.get('nextPageToken'):
+            next_page_token = response.get('nextPageToken')
+            self.next_page_tokens[self.live_chat_id] = next_page_token
+        info_log(f"Next page token updated: {next_page_token}")
+        
+        # Extract messages
+        for item in items:
+            
+            info_log(f"[YouTubeChatReader.get_new_messages] Processing message received: {str({k: str(v) for k,v in item.items()})}")    
+
+            if item['snippet']['type'] == 'textMessageEvent':
+                messages.append({
+                    'author': item['authorDetails']['displayName'],
+                    'text': item['snippet']['displayMessage'],
+                    'published_at': item['snippet']['publishedAt']
+                })
+        
+        # A page that is not full means we have caught up with the chat
+        ytcm_quota_scheduler.record_poll(len(items), self.polling_interval_ms, (len(items) >= max_results) and bool(response.get('nextPageToken')))
+
+        info_log(f"Retrieved {len(messages)} new messages")
+        
+        return messages
+
+    def reset_page_tokens(self):
+        """Forgets the saved chat cursors, so the next read starts from the chat history"""
+        self.next_page_tokens = {}
+        info_log("Live chat page tokens reset")
     
     def disconnect(self):
         """Disconnects from YouTube APIs"""
         self.youtube = None
         self.live_chat_id = None
+        self.reset_page_tokens()
+        self.invalidate_cache()
         self.connected = False
         # Delete the token file if it exists
         if os.path.exists(self.token_file):
@@ -228,41 +316,10 @@ class YouTubeChatReader:
             err_log("Not connected to YouTube", None)
             return '[NO LIVE STREAM IN PROGRESS]'
 
-        try:
-            # Get the list of active live broadcasts
-            request = self.youtube.liveBroadcasts().list(
-                part="snippet",
-                broadcastStatus="active",
-                maxResults=1
-            )
-            response = request.execute()
-
-            # Get the title from the first active broadcast
-            items = response.get('items', [])
-            if items:
-                return items[0]['snippet']['title']
-
-            # If not found in broadcasts, try livestreams
-            request = self.youtube.liveStreams().list(
-                part="snippet",
-                mine=True,
-                maxResults=1
-            )
-            response = request.execute()
-
-            items = response.get('items', [])
-            if items:
-                if items[0]['snippet']['isDefaultStream']:
-                    return items[0]['snippet']['title']
-
-            return '[NO LIVE STREAM IN PROGRESS]'
-
-        except HttpError as e:
-            err_log(f"HTTP error while retrieving live title: {str(e)}")
-            return ''
-        except Exception as e:
-            err_log(f"Error while retrieving live title: {str(e)}")
+        broadcast_info = self._get_broadcast_info()
+        if not broadcast_info:
             return ''
+        return broadcast_info['live_title'] or '[NO LIVE STREAM IN PROGRESS]'
 
     def get_channel_name(self):
         """Gets the name of the authenticated channel"""
@@ -271,22 +328,29 @@ class YouTubeChatReader:
             err_log("Not connected to YouTube", None)
             return '...'
 
+        if self._channel_name and ((time.monotonic() - self._channel_name_time) < YTCM_YT_METADATA_CACHE_TTL_S):
+            return self._channel_name
+
         try:
             # Get the authenticated channel's information
             request = self.youtube.channels().list(
                 part="snippet",
                 mine=True
             )
+            ytcm_quota_scheduler.record('channels.list')
             response = request.execute()
 
             # Get the channel name
             items = response.get('items', [])
             if items:
-                return items[0]['snippet']['title']
+                self._channel_name = items[0]['snippet']['title']
+                self._channel_name_time = time.monotonic()
+                return self._channel_name
 
             return '...'
 
         except HttpError as e:
+            self._check_quota_error(e)
             err_log(f"HTTP error while retrieving channel name: {str(e)}")
             return '...'
         except Exception as e: